@@ -18,16 +18,26 @@ import os
 import sys
 import json
 import base64
+import binascii
 import asyncio
 import threading
+import queue
+import heapq
 import signal
+import socket
 import time
+import traceback
 import re
 import subprocess
+import struct
 import io
 import wave
-import tempfile
-from datetime import datetime
+import concurrent.futures
+import collections
+import hashlib
+import importlib.util
+import math
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -36,16 +46,18 @@ from email import encoders
 import numpy as np
 import pyaudio
 import websockets
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
 
-# Gmail API
+from response_cache import ResponseCache, compute_image_hash
+
+# Gmail API（読み込みの重いモジュールはinit_gmail()のバックグラウンドスレッドで読み込む）
 try:
-    from google.auth.transport.requests import Request
-    from google.oauth2.credentials import Credentials
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from googleapiclient.discovery import build
     from googleapiclient.errors import HttpError
+    if importlib.util.find_spec("google_auth_oauthlib") is None:
+        raise ImportError("google_auth_oauthlib")
     GMAIL_AVAILABLE = True
 except ImportError:
     GMAIL_AVAILABLE = False
@@ -59,9 +71,73 @@ except ImportError:
     FIREBASE_AVAILABLE = False
     print("警告: firebase_voiceモジュールが見つかりません。音声メッセージ機能は無効です。")
 
+# PyAV（音声メッセージのデコード用、なければffmpegを使用）
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+# Pillow（画像解析前の縮小用、なければ元画像を送信）
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# SciPy（WAV再生時の高品質リサンプリング用、なければ線形補間。初回使用時に読み込む）
+SCIPY_AVAILABLE = importlib.util.find_spec("scipy") is not None
+
+# orjson（Realtime APIイベントやアラームファイルの高速なJSON処理用、なければ標準のjson）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    json_loads = orjson.loads
+    json_dumps_bytes = orjson.dumps  # UTF-8のbytesを直接返す
+
+    def json_dumps(obj):
+        """WebSocketのテキストフレーム用にstrで返す"""
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    ORJSON_AVAILABLE = False
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+    def json_dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+# pybase64（SIMD対応のbase64、画像・音声のエンコード用。なければ標準のbinascii）
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+
+    def b64encode_str(data):
+        return pybase64.b64encode_as_string(data)
+
+    def b64decode(text):
+        return pybase64.b64decode(text, validate=False)
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+    def b64encode_str(data):
+        return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+    def b64decode(text):
+        return binascii.a2b_base64(text)
+
+# uvloop（asyncioのイベントループを高速化、なければ標準のループ）
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+# Picamera2（カメラを開いたままにして撮影を高速化、なければrpicam-stillを使用。初回撮影時に読み込む）
+PICAMERA2_AVAILABLE = importlib.util.find_spec("picamera2") is not None
+
 # GPIOライブラリ
 try:
-    from gpiozero import Button
+    from gpiozero import Button, Device
     GPIO_AVAILABLE = True
 except ImportError:
     GPIO_AVAILABLE = False
@@ -73,6 +149,7 @@ sys.stderr.reconfigure(line_buffering=True)
 
 # 環境変数の読み込み
 load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Gmail APIスコープ
 GMAIL_SCOPES = [
@@ -81,6 +158,13 @@ GMAIL_SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify'
 ]
 
+# Gmailバッチリクエストの最大件数（API上限）
+GMAIL_BATCH_SIZE = 100
+
+# メールヘッダ解析用の正規表現（呼び出しごとのコンパイルを避ける）
+_FROM_NAME_RE = re.compile(r'(.+?)\s*<')
+_EMAIL_ADDR_RE = re.compile(r'<([^>]+)>')
+
 # 設定
 CONFIG = {
     # Realtime API設定
@@ -93,19 +177,31 @@ CONFIG = {
     "output_sample_rate": 48000,
     "channels": 1,
     "chunk_size": 1024,
+    "preroll_seconds": 0.1,  # ボタンを押す直前の音声をこの秒数分だけ録音に含める
+    "silence_cutoff_db": -40.0,  # 短時間パワーがこれ未満(dBFS)なら無音とみなす
+    "silence_window_length": 2048,  # 短時間パワーを平均するサンプル数
+    "silence_trim_padding": 0.3,  # 前後の無音を削るときに残す余白（秒）
+    "audio_rt_priority": 20,  # 音声コールバックのSCHED_FIFO優先度（0で無効）
 
     # デバイス設定
     "input_device_index": None,
     "output_device_index": None,
+    "audio_device_cache_path": os.path.expanduser("~/.ai-necklace/audio_devices.json"),
 
     # GPIO設定
     "button_pin": 5,
     "use_button": True,
+    "button_bounce_time": 0.02,  # 秒（チャタリング除去。長いと押下の反応が遅れる）
+    "button_pin_factory": "pigpio",  # pigpiodが動いていれば使う（なければgpiozeroの既定）
 
     # Gmail設定
     "gmail_credentials_path": os.path.expanduser("~/.ai-necklace/credentials.json"),
     "gmail_token_path": os.path.expanduser("~/.ai-necklace/token.json"),
 
+    # 音声メッセージ設定
+    "transcribe_voice_messages": True,  # 送信する音声メッセージに文字起こしを付ける
+    "transcription_timeout": 10,  # アップロード後に文字起こしを待つ最大秒数
+
     # アラーム設定
     "alarm_file_path": os.path.expanduser("~/.ai-necklace/alarms.json"),
 
@@ -113,6 +209,19 @@ CONFIG = {
     "lifelog_dir": os.path.expanduser("~/lifelog"),
     "lifelog_interval": 60,  # 1分（秒）
 
+    # カメラ設定
+    "photo_reuse_seconds": 30,  # 写真送信時、この秒数以内に撮った写真は撮り直さずに再利用
+    "vision_image_size": 512,  # GPT-4oに送る画像の最大辺（detail: lowの解像度）
+    "vision_jpeg_quality": 70,
+
+    # 定型音声キャッシュ設定
+    "tts_model": "tts-1",
+    "canned_speech_dir": os.path.expanduser("~/.ai-necklace/speech"),
+
+    # カメラ応答キャッシュ設定
+    "vision_cache_ttl": 600,  # 10分（秒）
+    "vision_cache_max_distance": 4,  # 同じ画像とみなすハッシュ距離
+
     # システムプロンプト
     "instructions": """あなたは親切なAIアシスタントです。
 ユーザーの質問に簡潔に答えてください。
@@ -150,17 +259,21 @@ voice_sendツールを呼び出した後、ユーザーが録音するまで「
 
 # グローバル変数
 running = True
+shutdown_loop = None  # main_async実行中のイベントループ
+shutdown_event = None  # 終了要求でセット（待機中のコルーチンをすぐ起こす）
 button = None
 is_recording = False
 openai_client = None
 
 # Gmail関連
 gmail_service = None
+gmail_initializing = False  # バックグラウンドで初期化中かどうか
 last_email_list = []
 
 # アラーム関連
 alarms = []
 alarm_next_id = 1
+alarm_saved_blob = None  # 最後に保存した内容（同一内容の書き込みを省略）
 
 # Firebase関連
 firebase_messenger = None
@@ -175,7 +288,7 @@ def check_and_reset_voice_message_mode():
     global voice_message_mode, voice_message_mode_timestamp
 
     if voice_message_mode and voice_message_mode_timestamp:
-        elapsed = time.time() - voice_message_mode_timestamp
+        elapsed = time.monotonic() - voice_message_mode_timestamp
         if elapsed > VOICE_MESSAGE_MODE_TIMEOUT:
             print(f"⚠️ voice_message_mode タイムアウト ({elapsed:.1f}秒経過) - リセット")
             voice_message_mode = False
@@ -197,23 +310,97 @@ def reset_voice_message_mode():
 lifelog_enabled = False
 lifelog_thread = None
 lifelog_photo_count = 0  # 今日の撮影枚数
+lifelog_file_counts = {}  # 日付ごとの保存済み写真の枚数（状態確認のたびにディレクトリを数えない）
+lifelog_wake = threading.Event()  # 開始・停止・終了時に待機中のスレッドを起こす
 
 # カメラ排他制御用ロック
 camera_lock = threading.Lock()
 
+# 最後に撮影した画像と撮影時刻（続けて写真を使うときは撮り直さない）
+last_capture_data = None  # JPEGのbytes（ファイルには保存しない）
+last_capture_time = None  # 最後に撮影した時刻（time.monotonic()）
+picam2 = None  # 開いたままのPicamera2（初回撮影時に起動）
+
+# カメラ応答キャッシュ（同じ質問・同じ景色ならGPT-4oを呼ばない）
+vision_cache = ResponseCache(
+    ttl=CONFIG["vision_cache_ttl"],
+    max_distance=CONFIG["vision_cache_max_distance"]
+)
+
 # グローバルオーディオハンドラ（スマホからの音声再生用）
 global_audio_handler = None
 
+# 受信メッセージのダウンロードを再生と並行して行うためのスレッドプール
+message_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+# 受信メッセージの再生用（ポーリングを止めない、複数届いても1件ずつ順番に再生）
+playback_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
 
 def signal_handler(sig, frame):
     """Ctrl+C で終了"""
     global running
     print("\n終了します...")
     running = False
+    lifelog_wake.set()
+    if shutdown_loop is not None:
+        # どのスレッドから呼ばれてもイベントループ側で待機中の処理を起こす
+        shutdown_loop.call_soon_threadsafe(shutdown_event.set)
+
+
+async def wait_for_shutdown(timeout):
+    """
+    終了要求があるまで最大timeout秒待つ
+
+    Returns:
+        終了要求があればTrue
+    """
+    try:
+        await asyncio.wait_for(shutdown_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
 
 
 # ==================== ユーティリティ ====================
 
+def enumerate_audio_devices(p):
+    """
+    全オーディオデバイスの情報を取得（PyAudioインスタンスごとに一度だけ）
+
+    Returns:
+        (デバイス情報のリスト, 今回取得したかどうか)
+    """
+    devices = getattr(p, "_cached_devices", None)
+    if devices is not None:
+        return devices, False
+    devices = [p.get_device_info_by_index(i) for i in range(p.get_device_count())]
+    p._cached_devices = devices  # 入力・出力の検索で共有
+    return devices, True
+
+
+def load_audio_device_cache():
+    """前回検出したオーディオデバイスを読み込み"""
+    try:
+        with open(CONFIG["audio_device_cache_path"], 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_audio_device_cache(device_type, index, name):
+    """検出したオーディオデバイスを保存（次回起動時の検索を省略）"""
+    cache = load_audio_device_cache()
+    if cache.get(device_type) == {"index": index, "name": name}:
+        return
+    cache[device_type] = {"index": index, "name": name}
+    try:
+        os.makedirs(os.path.dirname(CONFIG["audio_device_cache_path"]), exist_ok=True)
+        with open(CONFIG["audio_device_cache_path"], 'w') as f:
+            json.dump(cache, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"デバイスキャッシュ保存エラー: {e}")
+
+
 def find_audio_device(p, device_type="input"):
     """オーディオデバイスを自動検出"""
     # 入力デバイス用の名前リスト
@@ -221,59 +408,286 @@ def find_audio_device(p, device_type="input"):
     # 出力デバイス用の名前リスト
     output_target_names = ["usbspk", "UACDemo", "USB Audio", "USB PnP Audio", "default"]
     target_names = input_target_names if device_type == "input" else output_target_names
+    channel_key = "maxInputChannels" if device_type == "input" else "maxOutputChannels"
+    label = "入力" if device_type == "input" else "出力"
 
-    # デバッグ: 全デバイスを表示
-    print(f"=== オーディオデバイス一覧 ({device_type}) ===")
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
-        name = info.get("name", "")
-        in_ch = info.get("maxInputChannels", 0)
-        out_ch = info.get("maxOutputChannels", 0)
-        print(f"  [{i}] {name} (入力:{in_ch}ch, 出力:{out_ch}ch)")
+    # 前回と同じ番号に同じデバイスがあれば全デバイスの検索を省略
+    cached = load_audio_device_cache().get(device_type)
+    if cached:
+        try:
+            info = p.get_device_info_by_index(cached["index"])
+            if info.get("name") == cached["name"] and info.get(channel_key, 0) > 0:
+                print(f"✅ {label}デバイス検出: [{cached['index']}] {cached['name']} (前回と同じ)")
+                return cached["index"]
+        except Exception:
+            pass
+
+    devices, fresh = enumerate_audio_devices(p)
+
+    # デバッグ: 全デバイスを表示（取得したときだけ）
+    if fresh:
+        print("=== オーディオデバイス一覧 ===")
+        for i, info in enumerate(devices):
+            name = info.get("name", "")
+            in_ch = info.get("maxInputChannels", 0)
+            out_ch = info.get("maxOutputChannels", 0)
+            print(f"  [{i}] {name} (入力:{in_ch}ch, 出力:{out_ch}ch)")
 
     # USBデバイスを探す
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
+    for i, info in enumerate(devices):
         name = info.get("name", "")
-
-        if device_type == "input" and info.get("maxInputChannels", 0) > 0:
+        if info.get(channel_key, 0) > 0:
             for target in target_names:
                 if target in name:
-                    print(f"✅ 入力デバイス検出: [{i}] {name}")
-                    return i
-        elif device_type == "output" and info.get("maxOutputChannels", 0) > 0:
-            for target in target_names:
-                if target in name:
-                    print(f"✅ 出力デバイス検出: [{i}] {name}")
+                    print(f"✅ {label}デバイス検出: [{i}] {name}")
+                    save_audio_device_cache(device_type, i, name)
                     return i
 
-    # フォールバック: 最初に見つかった適切なデバイスを使用
+    # フォールバック: 最初に見つかった適切なデバイスを使用（キャッシュしない）
     print(f"⚠️ USBデバイスが見つかりません。代替デバイスを探しています...")
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
-        if device_type == "input" and info.get("maxInputChannels", 0) > 0:
-            print(f"📌 代替入力デバイス: [{i}] {info.get('name', '')}")
-            return i
-        elif device_type == "output" and info.get("maxOutputChannels", 0) > 0:
-            print(f"📌 代替出力デバイス: [{i}] {info.get('name', '')}")
+    for i, info in enumerate(devices):
+        if info.get(channel_key, 0) > 0:
+            print(f"📌 代替{label}デバイス: [{i}] {info.get('name', '')}")
             return i
 
     print(f"❌ {device_type}デバイスが見つかりません")
     return None
 
 
-def resample_audio(audio_data, from_rate, to_rate):
-    """オーディオをリサンプリング"""
+def set_realtime_priority(label):
+    """
+    呼び出したスレッドをSCHED_FIFOにする（PortAudioのコールバックスレッド用）
+    CPU負荷が高いときに通常のスレッドに割り込まれて音が途切れるのを防ぐ
+    権限がない場合（systemdのLimitRTPRIO未設定など）はそのまま続行
+    """
+    priority = CONFIG["audio_rt_priority"]
+    if not priority or not hasattr(os, "sched_setscheduler"):
+        return
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        print(f"⏱️ {label}スレッドをリアルタイム優先度({priority})に設定")
+    except OSError as e:
+        print(f"⚠️ {label}スレッドの優先度を変更できません: {e}")
+
+
+def resample_audio(audio_data, from_rate, to_rate, work=None):
+    """
+    オーディオをリサンプリング
+
+    Args:
+        work: 作業用配列を保持するdict（呼び出し元ごとに用意、スレッド間で共有しない）
+              指定すると線形補間の途中の配列をチャンクごとに確保しない
+    """
     if from_rate == to_rate:
         return audio_data
 
     audio_array = np.frombuffer(audio_data, dtype=np.int16)
     original_length = len(audio_array)
+    if original_length == 0:
+        return b""
+
+    # 2倍のアップサンプリング（API出力24kHz→スピーカー48kHz）は
+    # 元のサンプルの間に中点を挟むだけで済む（浮動小数点の補間不要）
+    if to_rate == from_rate * 2:
+        widened = audio_array.astype(np.int32)
+        resampled = np.empty(original_length * 2, dtype=np.int16)
+        resampled[0::2] = audio_array
+        resampled[1:-1:2] = (widened[:-1] + widened[1:]) >> 1
+        resampled[-1] = audio_array[-1]
+        return resampled.tobytes()
+
     target_length = int(original_length * to_rate / from_rate)
-    indices = np.linspace(0, original_length - 1, target_length)
-    resampled = np.interp(indices, np.arange(original_length), audio_array)
+    if original_length < 2 or target_length == 0:
+        return np.resize(audio_array, target_length).tobytes()
+
+    # 固定小数点(Q15)の線形補間（float64の配列を作らない）
+    indices, weights = get_resample_table(original_length, target_length)
+    if work is None:
+        samples = audio_array.astype(np.int32)
+        left = samples[indices]
+        resampled = left + (((samples[indices + 1] - left) * weights) >> 15)
+        return resampled.astype(np.int16).tobytes()
+
+    buffers = work.get((original_length, target_length))
+    if buffers is None:
+        buffers = (
+            np.empty(original_length, dtype=np.int32),
+            np.empty(target_length, dtype=np.int32),
+            np.empty(target_length, dtype=np.int32),
+            np.empty(target_length, dtype=np.int16),
+        )
+        work[(original_length, target_length)] = buffers
+    samples, left, right, out = buffers
+    samples[:] = audio_array
+    np.take(samples, indices, out=left)
+    np.take(samples[1:], indices, out=right)
+    right -= left
+    right *= weights
+    right >>= 15
+    right += left
+    out[:] = right
+    return out.tobytes()
+
+
+# 線形補間の位置と重み（チャンク長ごとにキャッシュ、マイク入力は毎回同じ長さ）
+_resample_tables = {}
+
+
+def get_resample_table(original_length, target_length):
+    """
+    線形補間で使う左側サンプルの位置とQ15の重みを取得
+
+    Returns:
+        (位置のint32配列, 重みのint32配列)
+    """
+    key = (original_length, target_length)
+    table = _resample_tables.get(key)
+    if table is None:
+        positions = np.linspace(0, original_length - 1, target_length)
+        indices = np.minimum(positions.astype(np.int32), original_length - 2)
+        weights = np.round((positions - indices) * 32768).astype(np.int32)
+        table = (indices, weights)
+        _resample_tables[key] = table
+    return table
+
+
+def upsample_2x(audio_data, history, out=None):
+    """
+    16bit PCMを2倍のサンプルレートにアップサンプリング（ストリーミング用）
+
+    元のサンプルはそのまま残し、間のサンプルを4タップのハーフバンドFIR
+    (-1, 9, 9, -1) / 16 で補間する。前のチャンクの末尾3サンプルを
+    historyとして引き継ぐため、チャンクの境目でも波形が途切れない
+    （出力は入力より2サンプル遅れる）
+
+    Args:
+        audio_data: 16bit PCM
+        history: 前回のチャンク末尾3サンプル（int32配列、初回はゼロ）
+        out: 書き込み先のint16配列（入力の2倍以上の長さ）。指定した場合は
+             bytesを新しく作らず、outを指すmemoryviewを返す
+
+    Returns:
+        (アップサンプリングしたPCM, 次回のhistory)
+    """
+    samples = np.frombuffer(audio_data, dtype=np.int16)
+    n = len(samples)
+    if n == 0:
+        return b"", history
+
+    x = np.concatenate((history, samples.astype(np.int32)))
+    middle = (9 * (x[1:-2] + x[2:-1]) - (x[:-3] + x[3:])) >> 4
+    np.clip(middle, -32768, 32767, out=middle)
+
+    resampled = np.empty(n * 2, dtype=np.int16) if out is None else out[:n * 2]
+    resampled[0::2] = x[1:-2]
+    resampled[1::2] = middle
+    if out is None:
+        return resampled.tobytes(), x[-3:].copy()
+    return memoryview(resampled).cast("B"), x[-3:].copy()
+
+
+# ポリフェーズフィルタの係数（変換比ごとにキャッシュ、TTSや効果音は毎回同じ比率）
+_poly_filters = {}
+
+
+def get_poly_ratio(from_rate, to_rate):
+    """サンプルレート変換の整数比 (up, down)"""
+    g = math.gcd(from_rate, to_rate)
+    return to_rate // g, from_rate // g
+
+
+def get_poly_filter(up, down):
+    """resample_polyの既定と同じローパスFIR係数を一度だけ設計して返す"""
+    taps = _poly_filters.get((up, down))
+    if taps is None:
+        from scipy.signal import firwin
+        max_rate = max(up, down)
+        taps = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+        _poly_filters[(up, down)] = taps
+    return taps
+
+
+def resample_buffer(audio_data, from_rate, to_rate):
+    """
+    音声全体をまとめてリサンプリング（WAV再生用）
+    SciPyがあればポリフェーズフィルタ、なければ線形補間を使用
+    """
+    if from_rate == to_rate:
+        return audio_data
+    if not SCIPY_AVAILABLE:
+        return resample_audio(audio_data, from_rate, to_rate)
+
+    from scipy.signal import resample_poly
+    up, down = get_poly_ratio(from_rate, to_rate)
+    audio_array = np.frombuffer(audio_data, dtype=np.int16)
+    resampled = resample_poly(audio_array, up, down, window=get_poly_filter(up, down))
+    return np.clip(resampled, -32768, 32767).astype(np.int16).tobytes()
+
+
+def wav_header(data_size, rate, channels=1, sampwidth=2):
+    """data_sizeバイトのPCM用の44バイトのWAVヘッダ"""
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, rate, rate * channels * sampwidth, channels * sampwidth, 8 * sampwidth,
+        b'data', data_size
+    )
+
+
+def pcm_to_wav(pcm, rate, channels=1, sampwidth=2):
+    """16bit PCMに44バイトのWAVヘッダを付ける（waveモジュールを経由しない）"""
+    return wav_header(len(pcm), rate, channels, sampwidth) + pcm
+
+
+# 音量計算用の作業バッファ（チャンクごとの配列確保を避ける、PortAudioのコールバック専用）
+_rms_scratch = np.empty(CONFIG["chunk_size"], dtype=np.int32)
+
+
+def chunk_rms(chunk):
+    """16bit PCMチャンクのRMS音量を計算"""
+    global _rms_scratch
+
+    samples = np.frombuffer(chunk, dtype=np.int16)
+    if len(samples) == 0:
+        return 0.0
+    if len(samples) > len(_rms_scratch):
+        _rms_scratch = np.empty(len(samples), dtype=np.int32)
+
+    # int16のままだと2乗でオーバーフローするためint32で計算
+    squared = _rms_scratch[:len(samples)]
+    np.square(samples, out=squared, dtype=np.int32)
+    return float(np.sqrt(squared.mean()))
+
+
+def find_voiced_range(levels, cutoff_db, window_length, chunk_samples, padding=0):
+    """
+    音声を含むチャンクの範囲を求める（前後の無音を削るため）
+
+    チャンクごとのパワーをwindow_lengthサンプル相当の移動平均で平滑化し、
+    cutoff_db（dBFS）以上になる最初と最後のチャンクを探す
+    単発のクリック音などでは音声ありと判定しない
+
+    Args:
+        levels: チャンクごとのRMS音量（chunk_rms()の結果）
+        cutoff_db: 無音とみなす上限（dBFS）
+        window_length: 短時間パワーを平均するサンプル数
+        chunk_samples: 1チャンクのサンプル数
+        padding: 前後に残す余白（チャンク数）
+
+    Returns:
+        (開始, 終了) のチャンク番号（終了は含まない）。無音ならNone
+    """
+    if not levels:
+        return None
+
+    power = np.square(np.asarray(levels, dtype=np.float64) / 32768.0)
+    width = max(1, round(window_length / chunk_samples))
+    short_term_power = np.convolve(power, np.full(width, 1.0 / width), mode="same")
+    voiced = np.flatnonzero(10 * np.log10(short_term_power + 1e-12) >= cutoff_db)
+    if len(voiced) == 0:
+        return None
 
-    return resampled.astype(np.int16).tobytes()
+    return max(0, int(voiced[0]) - padding), min(len(levels), int(voiced[-1]) + 1 + padding)
 
 
 # ==================== Gmail機能 ====================
@@ -286,6 +700,11 @@ def init_gmail():
         print("Gmail: 無効（ライブラリなし）")
         return False
 
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
     creds = None
     token_path = CONFIG["gmail_token_path"]
     credentials_path = CONFIG["gmail_credentials_path"]
@@ -308,7 +727,8 @@ def init_gmail():
             token.write(creds.to_json())
 
     try:
-        gmail_service = build('gmail', 'v1', credentials=creds)
+        # ライブラリ同梱のディスカバリ文書を使用（ネットワーク取得なし）
+        gmail_service = build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
         print("Gmail: 有効")
         return True
     except Exception as e:
@@ -316,12 +736,41 @@ def init_gmail():
         return False
 
 
+def start_gmail_init():
+    """Gmail初期化をバックグラウンドで開始（起動処理をブロックしない）"""
+    global gmail_initializing
+
+    def run():
+        global gmail_initializing
+        try:
+            init_gmail()
+        except Exception as e:
+            print(f"Gmail初期化エラー: {e}")
+        finally:
+            gmail_initializing = False
+
+    gmail_initializing = True
+    threading.Thread(target=run, daemon=True).start()
+
+
+def gmail_unavailable_message():
+    """Gmailが使えないときの応答メッセージ"""
+    if gmail_initializing:
+        return "Gmailをまだ初期化中です。少し待ってからもう一度お試しください"
+    return "Gmail機能が初期化されていません"
+
+
+def _parse_headers(msg):
+    """Gmail APIのメッセージからヘッダを {名前: 値} の辞書にする"""
+    return {h['name']: h['value'] for h in msg.get('payload', {}).get('headers', ())}
+
+
 def gmail_list_func(query="is:unread", max_results=5):
     """メール一覧を取得"""
     global gmail_service, last_email_list
 
     if not gmail_service:
-        return "Gmail機能が初期化されていません"
+        return gmail_unavailable_message()
 
     try:
         results = gmail_service.users().messages().list(
@@ -332,18 +781,35 @@ def gmail_list_func(query="is:unread", max_results=5):
         if not messages:
             return "該当するメールはありません"
 
+        # 本文までバッチリクエストでまとめて取得（1往復で済ませ、続くgmail_readは再取得しない）
+        details = {}
+
+        def collect(request_id, response, exception):
+            if exception is None:
+                details[int(request_id)] = response
+            else:
+                print(f"メール取得エラー (#{request_id}): {exception}")
+
+        for start in range(0, len(messages), GMAIL_BATCH_SIZE):
+            batch = gmail_service.new_batch_http_request(callback=collect)
+            for i, msg in enumerate(messages[start:start + GMAIL_BATCH_SIZE], start):
+                batch.add(
+                    gmail_service.users().messages().get(userId='me', id=msg['id'], format='full'),
+                    request_id=str(i)
+                )
+            batch.execute()
+
         email_list = []
         last_email_list = []
 
-        for i, msg in enumerate(messages, 1):
-            msg_detail = gmail_service.users().messages().get(
-                userId='me', id=msg['id'], format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
+        for i, msg in enumerate(messages):
+            msg_detail = details.get(i)
+            if msg_detail is None:
+                continue
 
-            headers = {h['name']: h['value'] for h in msg_detail.get('payload', {}).get('headers', [])}
+            headers = _parse_headers(msg_detail)
             from_header = headers.get('From', '不明')
-            from_match = re.match(r'(.+?)\s*<', from_header)
+            from_match = _FROM_NAME_RE.match(from_header)
             from_name = from_match.group(1).strip() if from_match else from_header.split('@')[0]
 
             email_info = {
@@ -351,9 +817,14 @@ def gmail_list_func(query="is:unread", max_results=5):
                 'from': from_name,
                 'from_email': from_header,
                 'subject': headers.get('Subject', '(件名なし)'),
+                'message': msg_detail,  # gmail_read用に本文ごと保持
             }
             last_email_list.append(email_info)
-            email_list.append(f"{i}. {from_name}さんから: {email_info['subject']}")
+            # gmail_read/gmail_reply の番号指定と一致させる
+            email_list.append(f"{len(last_email_list)}. {from_name}さんから: {email_info['subject']}")
+
+        if not email_list:
+            return "メールの取得に失敗しました"
 
         return "メール一覧:\n" + "\n".join(email_list)
 
@@ -366,7 +837,7 @@ def gmail_read_func(message_id):
     global gmail_service, last_email_list
 
     if not gmail_service:
-        return "Gmail機能が初期化されていません"
+        return gmail_unavailable_message()
 
     # 番号で指定された場合
     if isinstance(message_id, int) or (isinstance(message_id, str) and message_id.isdigit()):
@@ -376,12 +847,16 @@ def gmail_read_func(message_id):
         else:
             return "指定されたメールが見つかりません"
 
+    # 一覧取得時に本文まで取得済みならAPIを呼ばない
+    msg = next((e.get('message') for e in last_email_list if e['id'] == message_id), None)
+
     try:
-        msg = gmail_service.users().messages().get(
-            userId='me', id=message_id, format='full'
-        ).execute()
+        if msg is None:
+            msg = gmail_service.users().messages().get(
+                userId='me', id=message_id, format='full'
+            ).execute()
 
-        headers = {h['name']: h['value'] for h in msg.get('payload', {}).get('headers', [])}
+        headers = _parse_headers(msg)
         body = ""
         payload = msg.get('payload', {})
 
@@ -397,7 +872,7 @@ def gmail_read_func(message_id):
             body = body[:500] + "...(以下省略)"
 
         from_header = headers.get('From', '不明')
-        from_match = re.match(r'(.+?)\s*<', from_header)
+        from_match = _FROM_NAME_RE.match(from_header)
         from_name = from_match.group(1).strip() if from_match else from_header
 
         return f"送信者: {from_name}\n件名: {headers.get('Subject', '(件名なし)')}\n\n本文:\n{body}"
@@ -411,13 +886,13 @@ def gmail_send_func(to, subject, body):
     global gmail_service
 
     if not gmail_service:
-        return "Gmail機能が初期化されていません"
+        return gmail_unavailable_message()
 
     try:
         message = MIMEText(body)
         message['to'] = to
         message['subject'] = subject
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode("ascii")
 
         gmail_service.users().messages().send(
             userId='me', body={'raw': raw}
@@ -434,7 +909,7 @@ def gmail_reply_func(message_id, body, attach_photo=False):
     global gmail_service, last_email_list
 
     if not gmail_service:
-        return "Gmail機能が初期化されていません"
+        return gmail_unavailable_message()
 
     # 番号で指定された場合
     to_email = None
@@ -454,11 +929,11 @@ def gmail_reply_func(message_id, body, attach_photo=False):
             metadataHeaders=['From', 'Subject', 'Message-ID', 'References', 'Reply-To']
         ).execute()
 
-        headers = {h['name']: h['value'] for h in original.get('payload', {}).get('headers', [])}
+        headers = _parse_headers(original)
         to_raw = to_email or headers.get('Reply-To') or headers.get('From', '')
 
         # メールアドレス抽出
-        match = re.search(r'<([^>]+)>', to_raw)
+        match = _EMAIL_ADDR_RE.search(to_raw)
         to = match.group(1) if match else to_raw.strip()
 
         subject = headers.get('Subject', '')
@@ -471,7 +946,7 @@ def gmail_reply_func(message_id, body, attach_photo=False):
         message['to'] = to
         message['subject'] = subject
 
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode("ascii")
         gmail_service.users().messages().send(
             userId='me', body={'raw': raw, 'threadId': thread_id}
         ).execute()
@@ -496,7 +971,8 @@ def init_firebase():
     try:
         firebase_messenger = FirebaseVoiceMessenger(
             device_id="raspi",
-            on_message_received=on_voice_message_received
+            on_message_received=lambda msg: playback_executor.submit(on_voice_message_received, msg),
+            mark_played_on_receive=False  # 再生し終えてからon_voice_message_receivedでマーク
         )
         firebase_messenger.start_listening(poll_interval=1.5)
         print("Firebase Voice Messenger: 有効")
@@ -526,14 +1002,7 @@ def generate_shutter_sound():
         # 合成
         sound = ((noise * 0.3 + click * 0.7) * envelope * 0.4 * 32767).astype(np.int16)
 
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(sound.tobytes())
-
-        return wav_buffer.getvalue()
+        return pcm_to_wav(sound.tobytes(), sample_rate)
     except Exception as e:
         print(f"シャッター音生成エラー: {e}")
         return None
@@ -546,24 +1015,20 @@ def generate_notification_sound():
         duration1 = 0.15
         duration2 = 0.1
 
-        t1 = np.linspace(0, duration1, int(sample_rate * duration1), False)
-        tone1 = (np.sin(2 * np.pi * 880 * t1) * 0.3 * 32767).astype(np.int16)
+        n1 = int(sample_rate * duration1)
+        n_gap = int(sample_rate * 0.1)
+        n2 = int(sample_rate * duration2)
 
-        gap = np.zeros(int(sample_rate * 0.1), dtype=np.int16)
+        # 1つの配列に直接書き込む（音ごとの配列を作って連結しない）
+        sound = np.zeros(n1 + n_gap + n2, dtype=np.int16)
 
-        t2 = np.linspace(0, duration2, int(sample_rate * duration2), False)
-        tone2 = (np.sin(2 * np.pi * 1320 * t2) * 0.2 * 32767).astype(np.int16)
+        t1 = np.linspace(0, duration1, n1, False)
+        sound[:n1] = np.sin(2 * np.pi * 880 * t1) * 0.3 * 32767
 
-        sound = np.concatenate([tone1, gap, tone2])
+        t2 = np.linspace(0, duration2, n2, False)
+        sound[n1 + n_gap:] = np.sin(2 * np.pi * 1320 * t2) * 0.2 * 32767
 
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(sound.tobytes())
-
-        return wav_buffer.getvalue()
+        return pcm_to_wav(sound.tobytes(), sample_rate)
     except Exception as e:
         print(f"通知音生成エラー: {e}")
         return None
@@ -592,58 +1057,215 @@ def generate_startup_sound():
 
         sound = np.concatenate(sounds)
 
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(sound.tobytes())
-
-        return wav_buffer.getvalue()
+        return pcm_to_wav(sound.tobytes(), sample_rate)
     except Exception as e:
         print(f"起動音生成エラー: {e}")
         return None
 
 
+# 効果音は毎回同じなので起動時に一度だけ生成（撮影・受信のたびに作り直さない）
+SHUTTER_WAV = generate_shutter_sound()
+NOTIFY_WAV = generate_notification_sound()
+
+
+class ChunkStreamReader(io.RawIOBase):
+    """
+    受信中のバイト列（イテレータ）を読み出し可能なファイルとして扱う
+    デコーダが失敗した場合に備えて受信済みのデータも保持する
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.received = []
+        self.pending = b""
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.received.append(chunk)
+        self.pending = chunk
+        self.offset = 0
+        return True
+
+    def prefetch(self):
+        """最初のチャンクを受信（データがなければFalse）"""
+        return self.offset < len(self.pending) or self._next_chunk()
+
+    def readinto(self, b):
+        while self.offset >= len(self.pending):
+            if not self._next_chunk():
+                return 0
+        n = min(len(b), len(self.pending) - self.offset)
+        b[:n] = self.pending[self.offset:self.offset + n]
+        self.offset += n
+        return n
+
+    def read_all_received(self):
+        """残りを受信しきって、全データをbytesで返す"""
+        while self._next_chunk():
+            pass
+        return b"".join(self.received)
+
+    def close(self):
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+        super().close()
+
+
+def open_audio_stream(audio_url):
+    """音声のダウンロードを開始し、最初のデータを受信した時点で読み出し用ストリームを返す"""
+    reader = ChunkStreamReader(firebase_messenger.download_audio_stream(audio_url))
+    if not reader.prefetch():
+        reader.close()
+        return None
+    return reader
+
+
+def decode_webm_pcm_av(source):
+    """
+    PyAVでWebM音声をプロセス内デコードし、出力サンプルレートの
+    16bitモノラルPCMをフレームごとに返す（ffmpegの起動・一時ファイル不要）
+
+    Args:
+        source: WebMのbytes、または読み出し可能なファイルオブジェクト
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=CONFIG["output_sample_rate"])
+    with av.open(source) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                yield out.to_ndarray().tobytes()
+    # リサンプラ内に残ったサンプルを出力
+    for out in resampler.resample(None):
+        yield out.to_ndarray().tobytes()
+
+
 def convert_webm_to_wav(audio_data, filename="audio.webm"):
     """WebM音声をWAV形式に変換"""
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as webm_file:
-            webm_file.write(audio_data)
-            webm_path = webm_file.name
-
-        wav_path = webm_path.replace(".webm", ".wav")
+    if AV_AVAILABLE:
+        try:
+            pcm = b"".join(decode_webm_pcm_av(audio_data))
+            return pcm_to_wav(pcm, CONFIG["output_sample_rate"])
+        except Exception as e:
+            print(f"PyAVデコードエラー: {e}（ffmpegで再試行）")
 
+    try:
+        # 一時ファイルを使わずパイプで変換（SDカードへの書き込みなし）
+        # WAVヘッダはパイプ出力だとサイズが確定しないので、生PCMで受け取って付け直す
         result = subprocess.run([
-            "ffmpeg", "-y", "-i", webm_path,
-            "-ar", str(CONFIG["output_sample_rate"]), "-ac", "1", "-f", "wav", wav_path
-        ], capture_output=True, timeout=30)
+            "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+            "-ar", str(CONFIG["output_sample_rate"]), "-ac", "1", "-f", "s16le", "pipe:1"
+        ], input=audio_data, capture_output=True, timeout=30)
 
         if result.returncode != 0:
-            print(f"ffmpeg変換エラー: {result.stderr.decode()}")
+            print(f"ffmpeg変換エラー: {result.stderr.decode(errors='replace')}")
             return None
 
-        with open(wav_path, "rb") as f:
-            wav_data = f.read()
-
-        os.unlink(webm_path)
-        os.unlink(wav_path)
-
-        return wav_data
+        return pcm_to_wav(result.stdout, CONFIG["output_sample_rate"])
 
     except Exception as e:
         print(f"音声変換エラー: {e}")
         return None
 
 
-def play_audio_direct(audio_data):
-    """音声を直接再生（PyAudio使用）"""
+def stream_webm_to_pcm(source, chunk_bytes=4096):
+    """
+    WebM音声をデコードし、出力サンプルレートのPCMを逐次返す
+    変換完了を待たずに最初のチャンクから再生を始められる
+
+    Args:
+        source: WebMのbytes、または受信中の読み出し可能なファイルオブジェクト
+    """
+    if AV_AVAILABLE:
+        return decode_webm_pcm_av(source)
+    return stream_webm_to_pcm_ffmpeg(source, chunk_bytes)
+
+
+def stream_webm_to_pcm_ffmpeg(source, chunk_bytes=4096):
+    """ffmpegをパイプで起動してWebM音声をPCMに逐次デコード"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+         "-ar", str(CONFIG["output_sample_rate"]), "-ac", "1", "-f", "s16le", "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    def feed():
+        # stdoutの読み出しと並行して書き込む（パイプ詰まり防止）
+        try:
+            if isinstance(source, (bytes, bytearray)):
+                process.stdin.write(source)
+            else:
+                # 受信したそばからffmpegに渡す
+                while True:
+                    data = source.read(65536)
+                    if not data:
+                        break
+                    process.stdin.write(data)
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    total = 0
+    finished = False
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_bytes)
+            if not chunk:
+                finished = True
+                break
+            total += len(chunk)
+            yield chunk
+    finally:
+        try:
+            # 途中で打ち切られた場合はffmpegを終了させる
+            process.wait(timeout=5 if finished else 0)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        feeder.join(timeout=1)
+        stderr = process.stderr.read()
+        process.stdout.close()
+        process.stderr.close()
+        if total == 0 and stderr:
+            print(f"ffmpeg変換エラー: {stderr.decode(errors='replace')}")
+
+
+def play_audio_direct(audio_data, audio=None):
+    """
+    音声を直接再生（PyAudio使用）
+
+    Args:
+        audio_data: WAVデータ
+        audio: 使用するPyAudio（省略時はglobal_audio_handlerのものを使い、
+               なければその場で作成して終了時に破棄）
+    """
     if audio_data is None:
         print("音声データがありません")
         return
 
-    audio = pyaudio.PyAudio()
-    output_device = find_audio_device(audio, "output")
+    if audio is None and global_audio_handler:
+        audio = global_audio_handler.audio
+    owns_audio = audio is None
+    if owns_audio:
+        audio = pyaudio.PyAudio()
+    output_device = CONFIG["output_device_index"]
+    if output_device is None:
+        # 見つけたデバイスは以降の再生でも使う（毎回デバイスを検索しない）
+        output_device = find_audio_device(audio, "output")
+        CONFIG["output_device_index"] = output_device
 
     print("🔊 再生中...")
 
@@ -657,13 +1279,7 @@ def play_audio_direct(audio_data):
             # 48kHzにリサンプリングが必要な場合
             if original_rate != CONFIG["output_sample_rate"]:
                 frames = wf.readframes(wf.getnframes())
-                audio_np = np.frombuffer(frames, dtype=np.int16)
-                # 簡易リサンプリング
-                ratio = CONFIG["output_sample_rate"] / original_rate
-                new_length = int(len(audio_np) * ratio)
-                indices = np.linspace(0, len(audio_np) - 1, new_length).astype(int)
-                resampled = audio_np[indices]
-                frames = resampled.astype(np.int16).tobytes()
+                frames = resample_buffer(frames, original_rate, CONFIG["output_sample_rate"])
                 rate = CONFIG["output_sample_rate"]
             else:
                 frames = wf.readframes(wf.getnframes())
@@ -677,10 +1293,11 @@ def play_audio_direct(audio_data):
                 output_device_index=output_device
             )
 
-            # チャンクで再生
+            # チャンクで再生（memoryviewのスライスでチャンクごとのコピーを避ける）
             chunk_size = 4096
-            for i in range(0, len(frames), chunk_size):
-                stream.write(frames[i:i+chunk_size])
+            view = memoryview(frames)
+            for i in range(0, len(view), chunk_size):
+                stream.write(view[i:i+chunk_size])
 
             stream.stop_stream()
             stream.close()
@@ -688,7 +1305,35 @@ def play_audio_direct(audio_data):
     except Exception as e:
         print(f"再生エラー: {e}")
     finally:
-        audio.terminate()
+        if owns_audio:
+            audio.terminate()
+
+
+# 効果音の再生待ち（撮影などの処理を再生の完了で待たせない）
+effect_queue = queue.SimpleQueue()
+effect_thread = None
+
+
+def effect_worker():
+    """効果音を順番に再生するスレッド"""
+    while True:
+        wav_data = effect_queue.get()
+        # 開いたままの出力ストリームがあればそれを使う（PyAudioの初期化を省略）
+        if global_audio_handler and global_audio_handler.output_stream:
+            global_audio_handler.play_audio_buffer(wav_data)
+        else:
+            play_audio_direct(wav_data)
+
+
+def play_effect_async(wav_data):
+    """効果音を別スレッドで再生（呼び出し元はすぐに戻る）"""
+    global effect_thread
+    if wav_data is None:
+        return
+    if effect_thread is None:
+        effect_thread = threading.Thread(target=effect_worker, daemon=True)
+        effect_thread.start()
+    effect_queue.put(wav_data)
 
 
 def on_voice_message_received(message):
@@ -702,33 +1347,45 @@ def on_voice_message_received(message):
         print("⚠️ オーディオハンドラが初期化されていません")
         return
 
+    # 通知音の再生中にダウンロードを開始（待ち時間を重ねる）
+    audio_url = message.get("audio_url")
+    download = None
+    if audio_url:
+        download = message_executor.submit(open_audio_stream, audio_url)
+
     # 通知音を再生
-    notification = generate_notification_sound()
-    if notification:
-        global_audio_handler.play_audio_buffer(notification)
+    if NOTIFY_WAV:
+        global_audio_handler.play_audio_buffer(NOTIFY_WAV)
 
     try:
-        audio_url = message.get("audio_url")
-        if not audio_url:
+        if not download:
             print("音声URLがありません")
             return
 
-        # 音声データをダウンロード
-        audio_data = firebase_messenger.download_audio(audio_url)
-        if not audio_data:
+        reader = download.result()
+        if not reader:
             print("音声ダウンロードに失敗")
             return
 
-        # WebMをWAVに変換して再生
-        filename = message.get("filename", "audio.webm")
-        wav_data = convert_webm_to_wav(audio_data, filename)
-        if wav_data:
-            global_audio_handler.play_audio_buffer(wav_data)
-        else:
-            print("音声変換に失敗")
+        try:
+            # 受信しながらWebMをデコードして逐次再生（ダウンロード完了を待たない）
+            played = global_audio_handler.play_pcm_stream(stream_webm_to_pcm(reader))
+            if not played:
+                # ストリーミングできなかった場合は受信済みデータを変換して再生
+                filename = message.get("filename", "audio.webm")
+                wav_data = convert_webm_to_wav(reader.read_all_received(), filename)
+                if wav_data:
+                    global_audio_handler.play_audio_buffer(wav_data)
+                else:
+                    print("音声変換に失敗")
+        finally:
+            reader.close()
 
-        # 再生済みにマーク
-        firebase_messenger.mark_as_played(message.get("id"))
+        # 最後まで再生されてから再生済みにマーク（ボタン操作や再接続で破棄された場合はマークしない）
+        if global_audio_handler.wait_output_done():
+            firebase_messenger.mark_as_played(message.get("id"))
+        else:
+            print("⚠️ メッセージの再生が中断されました（未再生のまま）")
 
     except Exception as e:
         print(f"メッセージ受信処理エラー: {e}")
@@ -743,7 +1400,7 @@ def voice_send_func(message_text=None):
 
     # 録音モードを有効化（タイムスタンプ付き）
     voice_message_mode = True
-    voice_message_mode_timestamp = time.time()
+    voice_message_mode_timestamp = time.monotonic()
     print(f"📢 音声メッセージモード開始 (タイムアウト: {VOICE_MESSAGE_MODE_TIMEOUT}秒)")
 
     # シンプルな応答（AIがそのまま読み上げる）
@@ -762,18 +1419,9 @@ def voice_send_photo_func():
     try:
         # カメラロックを取得して撮影
         with camera_lock:
-            image_path = "/tmp/ai_necklace_photo_send.jpg"
-            result = subprocess.run(
-                ["rpicam-still", "-o", image_path, "-t", "500", "--width", "1280", "--height", "960"],
-                capture_output=True, timeout=10
-            )
-
-            if result.returncode != 0:
-                return f"写真の撮影に失敗しました: {result.stderr.decode()}"
-
-            # 写真データを読み込み
-            with open(image_path, "rb") as f:
-                photo_data = f.read()
+            photo_data, error = capture_photo(CONFIG["photo_reuse_seconds"])
+            if error is not None:
+                return f"写真の撮影に失敗しました: {error}"
 
         # ロック解放後にFirebaseに送信
         if firebase_messenger.send_photo_message(photo_data):
@@ -793,7 +1441,7 @@ def voice_send_photo_func():
 def record_voice_message_sync():
     """
     音声メッセージ用の同期録音（raspi-voice2と同じ方式）
-    グローバルオーディオハンドラのPyAudioインスタンスを再利用
+    グローバルオーディオハンドラのマイク入力ストリームを再利用
     """
     global running, button, global_audio_handler
 
@@ -801,33 +1449,17 @@ def record_voice_message_sync():
         print("❌ オーディオハンドラが初期化されていません")
         return None
 
-    # グローバルハンドラのPyAudioインスタンスを使用
-    audio = global_audio_handler.audio
-    input_device = find_audio_device(audio, "input")
-
-    if input_device is None:
-        print("❌ 入力デバイスが見つかりません")
-        return None
-
     print("🎤 音声メッセージ録音中... (ボタンを離すと停止)")
 
-    stream = None
-    try:
-        stream = audio.open(
-            format=pyaudio.paInt16,
-            channels=CONFIG["channels"],
-            rate=CONFIG["input_sample_rate"],  # 44100Hz
-            input=True,
-            input_device_index=input_device,
-            frames_per_buffer=CONFIG["chunk_size"]
-        )
-    except Exception as e:
-        print(f"❌ ストリーム開始エラー: {e}")
+    # 起動時に開いたマイク入力ストリームを共有（デバイスを開き直さない）
+    if not global_audio_handler.start_input_stream():
+        print("❌ ストリーム開始エラー")
         return None
 
     frames = []
+    levels = []  # チャンクごとのRMS音量（無音判定用）
     max_chunks = int(CONFIG["input_sample_rate"] / CONFIG["chunk_size"] * 60)  # 最大60秒
-    start_time = time.time()
+    deadline = time.monotonic() + 60
 
     try:
         while True:
@@ -835,7 +1467,7 @@ def record_voice_message_sync():
                 break
 
             # タイムアウト (60秒)
-            if time.time() - start_time > 60:
+            if time.monotonic() > deadline:
                 print("録音タイムアウト")
                 break
 
@@ -848,46 +1480,73 @@ def record_voice_message_sync():
                 print("最大録音時間に達しました")
                 break
 
-            try:
-                available = stream.get_read_available()
-                if available >= CONFIG["chunk_size"]:
-                    data = stream.read(CONFIG["chunk_size"], exception_on_overflow=False)
-                    frames.append(data)
-                else:
-                    time.sleep(0.001)
-            except Exception as e:
-                print(f"録音中にエラー: {e}")
-                break
+            while True:
+                frame = global_audio_handler.read_input_frame()
+                if frame is None:
+                    break
+                frames.append(frame[0])
+                levels.append(frame[1])
+
+            # ボタンが離されたらすぐに戻る
+            if button:
+                button.wait_for_release(timeout=0.05)
+            else:
+                time.sleep(0.01)
     finally:
-        # 必ずストリームを閉じる
-        if stream:
-            try:
-                stream.stop_stream()
-                stream.close()
-                print("🎤 音声メッセージ録音ストリーム終了")
-            except Exception as e:
-                print(f"ストリーム終了エラー: {e}")
+        global_audio_handler.stop_input_stream()
+
+    # 停止までに録音された残りを回収
+    while len(frames) < max_chunks:
+        frame = global_audio_handler.read_input_frame()
+        if frame is None:
+            break
+        frames.append(frame[0])
+        levels.append(frame[1])
+    print("🎤 音声メッセージ録音終了")
 
     if len(frames) < 5:
         print("録音が短すぎます")
         return None
 
-    # WAV形式に変換
-    wav_buffer = io.BytesIO()
-    with wave.open(wav_buffer, 'wb') as wf:
-        wf.setnchannels(CONFIG["channels"])
-        wf.setsampwidth(2)  # 16bit
-        wf.setframerate(CONFIG["input_sample_rate"])  # 44100Hz
-        wf.writeframes(b''.join(frames))
+    # 前後の無音を削る（無音のみなら文字起こし・アップロードを省略）
+    padding = int(CONFIG["silence_trim_padding"] * CONFIG["input_sample_rate"] / CONFIG["chunk_size"])
+    voiced = find_voiced_range(
+        levels, CONFIG["silence_cutoff_db"], CONFIG["silence_window_length"],
+        CONFIG["chunk_size"], padding
+    )
+    if voiced is None:
+        print("音声が検出されませんでした")
+        return None
+    frames = frames[voiced[0]:voiced[1]]
+
+    # WAV形式に変換（16bit, 44100Hz）
+    # ヘッダとチャンクを一度にjoinして、録音全体のコピーを1回で済ませる
+    data_size = sum(len(f) for f in frames)
+    header = wav_header(data_size, CONFIG["input_sample_rate"], CONFIG["channels"])
+    wav_data = b''.join([header, *frames])
 
-    wav_buffer.seek(0)
     print(f"✅ 録音完了: {len(frames)}チャンク, 約{len(frames) * CONFIG['chunk_size'] / CONFIG['input_sample_rate']:.1f}秒")
-    return wav_buffer
+    return wav_data
+
+
+def transcribe_voice_message(wav_data):
+    """録音した音声をWhisperで文字起こし（失敗時はNone）"""
+    try:
+        transcript = openai_client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.wav", wav_data, "audio/wav"),
+            language="ja"
+        )
+        print(f"変換されたテキスト: {transcript.text}")
+        return transcript.text
+    except Exception as e:
+        print(f"テキスト変換エラー: {e}")
+        return None
 
 
 def send_recorded_voice_message():
     """録音した音声をスマホに送信"""
-    global firebase_messenger, openai_client, voice_message_mode, voice_message_mode_timestamp
+    global firebase_messenger, voice_message_mode, voice_message_mode_timestamp
 
     # 使用開始時点で即座にリセット（どんな結果でも1回限り）
     voice_message_mode = False
@@ -896,31 +1555,29 @@ def send_recorded_voice_message():
 
     try:
         # 同期録音を実行
-        wav_buffer = record_voice_message_sync()
+        wav_data = record_voice_message_sync()
 
-        if wav_buffer is None:
+        if wav_data is None:
             print("❌ 録音データがありません")
             return False
 
-        # Whisperで文字起こし
-        print("🔤 音声をテキストに変換中...")
-        transcribed_text = None
-        try:
-            wav_buffer.seek(0)
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=("audio.wav", wav_buffer, "audio/wav"),
-                language="ja"
-            )
-            transcribed_text = transcript.text
-            print(f"変換されたテキスト: {transcribed_text}")
-        except Exception as e:
-            print(f"テキスト変換エラー: {e}")
+        # Whisperでの文字起こしとアップロードを並行して実行（無効なら音声のみ送信）
+        transcribe = CONFIG["transcribe_voice_messages"]
+        if transcribe:
+            print("🔤 音声をテキストに変換中...")
+            transcription = message_executor.submit(transcribe_voice_message, wav_data)
+
+        def wait_for_transcript():
+            # 文字起こしが遅れても音声の送信は止めない
+            try:
+                return transcription.result(timeout=CONFIG["transcription_timeout"])
+            except concurrent.futures.TimeoutError:
+                print("⚠️ 文字起こしがタイムアウトしました（音声のみ送信）")
+                return None
 
-        # Firebaseに送信
+        # Firebaseに送信（アップロード完了後に文字起こし結果を待って登録）
         print("📤 スマホに送信中...")
-        wav_buffer.seek(0)
-        if firebase_messenger.send_message(wav_buffer.read(), text=transcribed_text):
+        if firebase_messenger.send_message(wav_data, text=wait_for_transcript if transcribe else None):
             print("✅ メッセージをスマホに送信しました")
             return True
         else:
@@ -932,6 +1589,71 @@ def send_recorded_voice_message():
         return False
 
 
+# ==================== 定型音声キャッシュ ====================
+
+# 毎回同じ内容を読み上げる通知（Realtime APIで生成せず、保存した音声を再生）
+CANNED_PHRASES = [
+    "メッセージをスマホに送信しました。",
+    "送信に失敗しました。",
+]
+canned_speech = {}  # テキスト → PCM (24kHz, 16bit, モノラル)
+
+
+def canned_speech_path(text):
+    """定型文の音声ファイルのパス（モデル・声・テキストごと）"""
+    key = hashlib.sha1(f"{CONFIG['tts_model']}|{CONFIG['voice']}|{text}".encode("utf-8")).hexdigest()
+    return os.path.join(CONFIG["canned_speech_dir"], f"{key}.pcm")
+
+
+def get_canned_speech(text):
+    """
+    定型文の音声を取得（メモリ → ディスク → TTS APIの順）
+
+    Returns:
+        24kHz 16bit PCM（取得できない場合はNone）
+    """
+    pcm = canned_speech.get(text)
+    if pcm:
+        return pcm
+
+    path = canned_speech_path(text)
+    try:
+        with open(path, "rb") as f:
+            pcm = f.read()
+    except OSError:
+        if not openai_client:
+            return None
+        try:
+            response = openai_client.audio.speech.create(
+                model=CONFIG["tts_model"],
+                voice=CONFIG["voice"],
+                input=text,
+                response_format="pcm"
+            )
+            pcm = response.content
+            os.makedirs(CONFIG["canned_speech_dir"], exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(pcm)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"定型音声の生成エラー: {e}")
+            return None
+
+    if not pcm:
+        return None
+    canned_speech[text] = pcm
+    return pcm
+
+
+def prepare_canned_speech():
+    """定型文の音声をバックグラウンドで用意"""
+    def prepare():
+        for text in CANNED_PHRASES:
+            get_canned_speech(text)
+
+    threading.Thread(target=prepare, daemon=True).start()
+
+
 # ==================== アラーム機能 ====================
 
 def load_alarms():
@@ -939,8 +1661,8 @@ def load_alarms():
     global alarms, alarm_next_id
     try:
         if os.path.exists(CONFIG["alarm_file_path"]):
-            with open(CONFIG["alarm_file_path"], 'r') as f:
-                data = json.load(f)
+            with open(CONFIG["alarm_file_path"], 'rb') as f:
+                data = json_loads(f.read())
                 alarms = data.get('alarms', [])
                 alarm_next_id = data.get('next_id', 1)
                 print(f"アラーム: {len(alarms)}件読み込み")
@@ -949,14 +1671,27 @@ def load_alarms():
         alarms = []
         alarm_next_id = 1
 
+    rebuild_alarm_heap()
+
 
 def save_alarms():
-    """アラームを保存"""
-    global alarms, alarm_next_id
+    """アラームを保存（alarm_condを取得して呼び出す）"""
+    global alarms, alarm_next_id, alarm_saved_blob
+    blob = json_dumps_bytes({'alarms': alarms, 'next_id': alarm_next_id})
+    if blob == alarm_saved_blob:
+        return
+
+    path = CONFIG["alarm_file_path"]
+    tmp_path = path + '.tmp'
     try:
-        os.makedirs(os.path.dirname(CONFIG["alarm_file_path"]), exist_ok=True)
-        with open(CONFIG["alarm_file_path"], 'w') as f:
-            json.dump({'alarms': alarms, 'next_id': alarm_next_id}, f, ensure_ascii=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 一時ファイルに書いてから置き換え（電源断でも壊れない）
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        alarm_saved_blob = blob
     except Exception as e:
         print(f"アラーム保存エラー: {e}")
 
@@ -972,18 +1707,21 @@ def alarm_set_func(time_str, label="アラーム", message=""):
     except:
         return "時刻の形式が不正です。HH:MM形式（例: 07:00）で指定してください。"
 
-    alarm = {
-        "id": alarm_next_id,
-        "time": time_str,
-        "label": label,
-        "message": message or f"{label}の時間です",
-        "enabled": True,
-        "created_at": datetime.now().isoformat()
-    }
+    # ツールは別スレッドで実行されるので、監視スレッドと同じロックで一覧を更新
+    with alarm_cond:
+        alarm = {
+            "id": alarm_next_id,
+            "time": time_str,
+            "label": label,
+            "message": message or f"{label}の時間です",
+            "enabled": True,
+            "created_at": datetime.now().isoformat()
+        }
 
-    alarms.append(alarm)
-    alarm_next_id += 1
-    save_alarms()
+        alarms.append(alarm)
+        alarm_next_id += 1
+        save_alarms()
+        rebuild_alarm_heap()
 
     return f"{time_str}に「{label}」のアラームを設定しました。"
 
@@ -992,11 +1730,14 @@ def alarm_list_func():
     """アラーム一覧を取得"""
     global alarms
 
-    if not alarms:
+    with alarm_cond:
+        current = list(alarms)
+
+    if not current:
         return "設定されているアラームはありません。"
 
     result = "アラーム一覧:\n"
-    for alarm in alarms:
+    for alarm in current:
         status = "有効" if alarm.get("enabled", True) else "無効"
         result += f"{alarm['id']}. {alarm['time']} - {alarm['label']} ({status})\n"
 
@@ -1012,11 +1753,13 @@ def alarm_delete_func(alarm_id):
     except:
         return "アラームIDは数字で指定してください。"
 
-    for i, alarm in enumerate(alarms):
-        if alarm['id'] == alarm_id:
-            deleted = alarms.pop(i)
-            save_alarms()
-            return f"「{deleted['label']}」({deleted['time']})のアラームを削除しました。"
+    with alarm_cond:
+        for i, alarm in enumerate(alarms):
+            if alarm['id'] == alarm_id:
+                deleted = alarms.pop(i)
+                save_alarms()
+                rebuild_alarm_heap()
+                return f"「{deleted['label']}」({deleted['time']})のアラームを削除しました。"
 
     return f"ID {alarm_id} のアラームが見つかりません。"
 
@@ -1024,69 +1767,91 @@ def alarm_delete_func(alarm_id):
 # アラーム監視用のグローバル変数
 alarm_thread = None
 alarm_client = None  # RealtimeClientへの参照
+alarm_heap = []  # (発動時刻のepoch秒, アラームID) の最小ヒープ
+alarm_cond = threading.Condition()  # alarms・alarm_next_id・保存の排他と、変更時に監視スレッドを起こす
 
 
-def check_alarms_and_notify():
-    """アラームをチェックして通知（バックグラウンドスレッド用）"""
-    global running, alarms, alarm_client
+def next_alarm_epoch(time_str, now=None):
+    """HH:MM形式の時刻が次に来るepoch秒を計算（その分の間なら今すぐ）"""
+    now = now or time.time()
+    hour, minute = map(int, time_str.split(':'))
+    target = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    fire_at = target.timestamp()
+    if fire_at + 60 <= now:
+        fire_at = (target + timedelta(days=1)).timestamp()
+    return fire_at
 
-    last_triggered = {}  # 同じアラームが連続で鳴らないように
 
-    while running:
+def rebuild_alarm_heap():
+    """アラーム一覧から発動予定ヒープを作り直し、監視スレッドを起こす"""
+    global alarm_heap
+
+    now = time.time()
+    heap = []
+    for alarm in alarms:
+        if not alarm.get("enabled", True):
+            continue
         try:
-            now = datetime.now()
-            current_time = now.strftime("%H:%M")
+            heap.append((next_alarm_epoch(alarm['time'], now), alarm['id']))
+        except (ValueError, KeyError):
+            print(f"アラーム時刻が不正です: {alarm}")
+    heapq.heapify(heap)
 
-            alarms_to_delete = []  # 削除するアラームのIDリスト
+    with alarm_cond:
+        alarm_heap = heap
+        alarm_cond.notify()
+
+
+def notify_alarm(alarm):
+    """Realtime APIを通じてアラームを音声通知"""
+    if alarm_client and alarm_client.is_connected:
+        try:
+            message = alarm.get('message', f"{alarm['label']}の時間です")
+            notification = f"アラームです。{message}"
+            # 非同期で送信するためにスレッドセーフな方法で
+            asyncio.run_coroutine_threadsafe(
+                alarm_client.send_text_message(notification),
+                alarm_client.loop
+            )
+        except Exception as e:
+            print(f"アラーム通知エラー: {e}")
 
-            for alarm in alarms:
-                if not alarm.get("enabled", True):
-                    continue
 
-                alarm_id = alarm['id']
-                alarm_time = alarm['time']
+def check_alarms_and_notify():
+    """次のアラーム時刻まで待機して通知（バックグラウンドスレッド用）"""
+    global running, alarms
+
+    while running:
+        try:
+            with alarm_cond:
+                if not alarm_heap:
+                    alarm_cond.wait(timeout=60)
+                    continue
 
-                # 同じ分に複数回鳴らないようにチェック
-                trigger_key = f"{alarm_id}_{current_time}"
-                if trigger_key in last_triggered:
+                fire_at, alarm_id = alarm_heap[0]
+                wait = fire_at - time.time()
+                if wait > 0:
+                    # 時計合わせ（NTP同期）に追従するため最大60秒で再計算
+                    alarm_cond.wait(timeout=min(wait, 60))
                     continue
 
-                if alarm_time == current_time:
-                    print(f"🔔 アラーム発動: {alarm['label']} ({alarm_time})")
-                    last_triggered[trigger_key] = True
+                heapq.heappop(alarm_heap)
 
-                    # Realtime APIを通じて音声通知
-                    if alarm_client and alarm_client.is_connected:
-                        try:
-                            message = alarm.get('message', f"{alarm['label']}の時間です")
-                            notification = f"アラームです。{message}"
-                            # 非同期で送信するためにスレッドセーフな方法で
-                            asyncio.run_coroutine_threadsafe(
-                                alarm_client.send_text_message(notification),
-                                alarm_client.loop
-                            )
-                        except Exception as e:
-                            print(f"アラーム通知エラー: {e}")
-
-                    # 発動したアラームを削除リストに追加
-                    alarms_to_delete.append(alarm_id)
-
-            # 発動したアラームを削除
-            if alarms_to_delete:
-                for alarm_id in alarms_to_delete:
-                    alarms[:] = [a for a in alarms if a['id'] != alarm_id]
-                    print(f"🗑️ アラーム削除: ID {alarm_id}")
+                alarm = next((a for a in alarms if a['id'] == alarm_id), None)
+                if alarm is None or not alarm.get("enabled", True):
+                    continue
+
+                # 発動したアラームを削除（ツールからの追加・削除と競合しないようロック内で）
+                alarms[:] = [a for a in alarms if a['id'] != alarm_id]
                 save_alarms()
 
-            # 古いトリガー記録をクリア（1分以上前のもの）
-            keys_to_remove = [k for k in last_triggered if not k.endswith(current_time)]
-            for k in keys_to_remove:
-                del last_triggered[k]
+            print(f"🔔 アラーム発動: {alarm['label']} ({alarm['time']})")
+            notify_alarm(alarm)
+            print(f"🗑️ アラーム削除: ID {alarm_id}")
 
         except Exception as e:
             print(f"アラームチェックエラー: {e}")
-
-        time.sleep(10)  # 10秒ごとにチェック
+            time.sleep(10)
 
 
 def start_alarm_thread():
@@ -1099,26 +1864,125 @@ def start_alarm_thread():
 
 # ==================== カメラ機能 ====================
 
+def get_camera():
+    """
+    開いたままのPicamera2を取得（初回のみ起動、camera_lockを取得して呼び出す）
+    使えない場合はNone（rpicam-stillにフォールバック）
+    """
+    global picam2, PICAMERA2_AVAILABLE
+
+    if picam2 is None and PICAMERA2_AVAILABLE:
+        try:
+            from picamera2 import Picamera2
+            camera = Picamera2()
+            camera.configure(camera.create_still_configuration(main={"size": (1280, 960)}))
+            camera.start()
+            picam2 = camera
+            print("📷 カメラ起動（以降は開いたまま撮影）")
+        except Exception as e:
+            print(f"Picamera2初期化エラー: {e}（rpicam-stillを使用）")
+            PICAMERA2_AVAILABLE = False
+    return picam2
+
+
+def take_picture():
+    """
+    1280x960のJPEGをメモリ上に撮影（camera_lockを取得して呼び出す）
+    カメラの起動・露出調整を撮影ごとに繰り返さないようPicamera2を優先
+
+    Returns:
+        (JPEGのbytes, エラーメッセージ) のタプル（成功時はエラーがNone）
+    """
+    camera = get_camera()
+    if camera is not None:
+        try:
+            buf = io.BytesIO()
+            camera.capture_file(buf, format="jpeg")
+            return buf.getvalue(), None
+        except Exception as e:
+            return None, f"撮影エラー: {e}"
+
+    # 一時ファイルを介さず標準出力で受け取る
+    result = subprocess.run(
+        ["rpicam-still", "-o", "-", "-t", "500", "--width", "1280", "--height", "960"],
+        capture_output=True, timeout=10
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None, result.stderr.decode(errors="replace") or "撮影エラー"
+    return result.stdout, None
+
+
+def close_camera():
+    """開いたままのカメラを閉じる"""
+    global picam2
+    if picam2 is not None:
+        try:
+            picam2.stop()
+            picam2.close()
+        except Exception as e:
+            print(f"カメラ終了エラー: {e}")
+        picam2 = None
+
+
+def capture_photo(max_age=0):
+    """
+    カメラで撮影（camera_lockを取得して呼び出す）
+    max_age秒以内に撮影した写真があれば撮り直さずに再利用
+
+    Returns:
+        (JPEGのbytes, エラーメッセージ) のタプル（成功時はエラーがNone）
+    """
+    global last_capture_data, last_capture_time
+
+    if (max_age and last_capture_data is not None
+            and time.monotonic() - last_capture_time < max_age):
+        print("📷 直前に撮影した写真を再利用")
+        return last_capture_data, None
+
+    data, error = take_picture()
+    if error is not None:
+        return None, error
+
+    last_capture_data = data
+    last_capture_time = time.monotonic()
+    return data, None
+
+
+def encode_image_for_vision(image_data):
+    """GPT-4o Vision用にJPEG画像（bytes）を縮小・再圧縮してbase64文字列にする"""
+    if PIL_AVAILABLE:
+        try:
+            size = CONFIG["vision_image_size"]
+            with Image.open(io.BytesIO(image_data)) as im:
+                # JPEGはDCTスケーリングで縮小デコードして高速化
+                im.draft("RGB", (size, size))
+                small = im.convert("RGB")
+            small.thumbnail((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            small.save(buf, "JPEG", quality=CONFIG["vision_jpeg_quality"], optimize=True)
+            return b64encode_str(buf.getvalue())
+        except Exception as e:
+            print(f"画像縮小エラー: {e}（元画像を送信）")
+
+    return b64encode_str(image_data)
+
+
 def camera_capture_func(prompt="この画像に何が写っていますか？簡潔に説明してください。"):
     """カメラで撮影してGPT-4oで画像を解析"""
-    global openai_client, camera_lock
+    global openai_client, camera_lock, vision_cache
 
     # カメラロックを取得
     with camera_lock:
         print("📷 カメラで撮影中...")
 
         try:
-            image_path = "/tmp/ai_necklace_capture.jpg"
-            result = subprocess.run(
-                ["rpicam-still", "-o", image_path, "-t", "500", "--width", "1280", "--height", "960"],
-                capture_output=True, text=True, timeout=10
-            )
-
-            if result.returncode != 0:
-                return f"カメラでの撮影に失敗しました: {result.stderr}"
+            # 質問のたびにカメラの向きが変わっている可能性があるので必ず撮り直す
+            photo_data, error = capture_photo(0)
+            if error is not None:
+                return f"カメラでの撮影に失敗しました: {error}"
 
-            with open(image_path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode("utf-8")
+            image_data = encode_image_for_vision(photo_data)
+            image_hash = compute_image_hash(io.BytesIO(photo_data))
 
         except subprocess.TimeoutExpired:
             return "カメラの撮影がタイムアウトしました"
@@ -1127,6 +1991,12 @@ def camera_capture_func(prompt="この画像に何が写っていますか？簡
         except Exception as e:
             return f"カメラエラー: {str(e)}"
 
+    # 同じ質問・ほぼ同じ画像ならキャッシュした応答を返す
+    cached = vision_cache.get(prompt, image_hash)
+    if cached:
+        print("💾 キャッシュ済みの画像解析結果を使用")
+        return cached
+
     # ロック解放後に画像解析（時間がかかるのでロック外で実行）
     print("🔍 画像を解析中...")
 
@@ -1143,7 +2013,9 @@ def camera_capture_func(prompt="この画像に何が写っていますか？簡
             max_tokens=300
         )
 
-        return response.choices[0].message.content
+        answer = response.choices[0].message.content
+        vision_cache.put(prompt, image_hash, answer)
+        return answer
 
     except Exception as e:
         return f"画像解析エラー: {str(e)}"
@@ -1154,30 +2026,23 @@ def gmail_send_photo_func(to=None, subject="写真を送ります", body=""):
     global gmail_service, last_email_list, camera_lock
 
     if not gmail_service:
-        return "Gmail機能が初期化されていません"
+        return gmail_unavailable_message()
 
     if not to:
         if not last_email_list:
             return "送信先が指定されていません。"
         to_raw = last_email_list[0].get('from_email', '')
-        match = re.search(r'<([^>]+)>', to_raw)
+        match = _EMAIL_ADDR_RE.search(to_raw)
         to = match.group(1) if match else to_raw.strip()
 
     try:
         # カメラロックを取得して撮影
         with camera_lock:
             print("📷 写真を撮影中...")
-            image_path = "/tmp/ai_necklace_capture.jpg"
-            result = subprocess.run(
-                ["rpicam-still", "-o", image_path, "-t", "500", "--width", "1280", "--height", "960"],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode != 0:
+            img_data, error = capture_photo(CONFIG["photo_reuse_seconds"])
+            if error is not None:
                 return f"写真の撮影に失敗しました"
 
-            with open(image_path, 'rb') as f:
-                img_data = f.read()
-
         # ロック解放後にメール送信
         message = MIMEMultipart()
         message['to'] = to
@@ -1191,8 +2056,10 @@ def gmail_send_photo_func(to=None, subject="写真を送ります", body=""):
         img_part.add_header('Content-Disposition', 'attachment', filename=filename)
         message.attach(img_part)
 
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        gmail_service.users().messages().send(userId='me', body={'raw': raw}).execute()
+        # 写真付きはMIMEをそのままアップロード（rawにすると画像部分をさらにbase64化した文字列ができる）
+        from googleapiclient.http import MediaIoBaseUpload
+        media = MediaIoBaseUpload(io.BytesIO(message.as_bytes()), mimetype='message/rfc822')
+        gmail_service.users().messages().send(userId='me', body={}, media_body=media).execute()
 
         to_name = to.split('@')[0]
         return f"{to_name}さんに写真付きメールを送信しました"
@@ -1223,26 +2090,24 @@ def capture_lifelog_photo():
         filename = f"{timestamp}.jpg"
         image_path = os.path.join(lifelog_dir, filename)
 
-        # カメラで撮影
-        result = subprocess.run(
-            ["rpicam-still", "-o", image_path, "-t", "500", "--width", "1280", "--height", "960"],
-            capture_output=True, timeout=10
-        )
+        # カメラで撮影（撮影データはそのままアップロードにも使う）
+        photo_data, error = take_picture()
+        if error is None:
+            with open(image_path, "wb") as f:
+                f.write(photo_data)
 
-        if result.returncode == 0:
+        if error is None:
             lifelog_photo_count += 1
+            if today in lifelog_file_counts:
+                lifelog_file_counts[today] += 1
             print(f"📸 ライフログ撮影: {image_path} (今日{lifelog_photo_count}枚目)")
 
             # シャッター音を再生
-            shutter_sound = generate_shutter_sound()
-            if shutter_sound:
-                play_audio_direct(shutter_sound)
+            play_effect_async(SHUTTER_WAV)
 
             # Firebaseにアップロード（非同期的に実行、失敗してもローカル保存は成功とする）
             if firebase_messenger:
                 try:
-                    with open(image_path, "rb") as f:
-                        photo_data = f.read()
                     if firebase_messenger.upload_lifelog_photo(photo_data, today, timestamp):
                         print(f"☁️ Firebaseアップロード成功")
                     else:
@@ -1252,7 +2117,7 @@ def capture_lifelog_photo():
 
             return True
         else:
-            print(f"❌ ライフログ撮影失敗: {result.stderr.decode()}")
+            print(f"❌ ライフログ撮影失敗: {error}")
             return False
 
     except subprocess.TimeoutExpired:
@@ -1273,6 +2138,8 @@ def lifelog_thread_func():
     retry_interval = 30  # リトライ間隔（秒）
 
     while running:
+        # 撮影前に起床要求を消す（撮影中に来た開始・停止だけが次の待機を起こす）
+        lifelog_wake.clear()
         if lifelog_enabled:
             # 日付が変わったらカウントをリセット
             current_date = datetime.now().strftime("%Y-%m-%d")
@@ -1293,25 +2160,24 @@ def lifelog_thread_func():
         else:
             wait_time = CONFIG["lifelog_interval"]
 
-        # 次の撮影まで待機（1秒ごとにチェックして停止に素早く対応）
-        for _ in range(wait_time):
-            if not running:
-                break
-            if lifelog_enabled:
-                time.sleep(1)
-            else:
-                # ライフログ無効時は長めにスリープ
-                time.sleep(5)
-                break
+        # 次の撮影まで待機（開始・停止・終了時はすぐに起こされる、無効時は起こされるまで待つ）
+        lifelog_wake.wait(timeout=wait_time if lifelog_enabled else None)
 
 
 def start_lifelog_thread():
-    """ライフログスレッドを開始"""
+    """
+    ライフログスレッドを開始
+
+    Returns:
+        新しくスレッドを起動した場合はTrue（既に動作中ならFalse）
+    """
     global lifelog_thread
     if lifelog_thread is None or not lifelog_thread.is_alive():
         lifelog_thread = threading.Thread(target=lifelog_thread_func, daemon=True)
         lifelog_thread.start()
         print("📷 ライフログスレッド開始")
+        return True
+    return False
 
 
 def lifelog_start_func():
@@ -1322,7 +2188,9 @@ def lifelog_start_func():
         return "ライフログは既に動作中です。"
 
     lifelog_enabled = True
-    start_lifelog_thread()
+    # 新しく起動したスレッドはすぐに撮影するので、待機中の既存スレッドだけを起こす
+    if not start_lifelog_thread():
+        lifelog_wake.set()
 
     interval_min = CONFIG["lifelog_interval"] // 60
     return f"ライフログを開始しました。{interval_min}分ごとに自動撮影します。"
@@ -1336,6 +2204,7 @@ def lifelog_stop_func():
         return "ライフログは動作していません。"
 
     lifelog_enabled = False
+    lifelog_wake.set()
     return "ライフログを停止しました。"
 
 
@@ -1347,10 +2216,14 @@ def lifelog_status_func():
     today = datetime.now().strftime("%Y-%m-%d")
     lifelog_dir = os.path.join(CONFIG["lifelog_dir"], today)
 
-    # 実際のファイル数をカウント
-    actual_count = 0
-    if os.path.exists(lifelog_dir):
-        actual_count = len([f for f in os.listdir(lifelog_dir) if f.endswith('.jpg')])
+    # 実際のファイル数（その日の初回だけ数え、以降は撮影時に加算した値を使う）
+    actual_count = lifelog_file_counts.get(today)
+    if actual_count is None:
+        actual_count = 0
+        if os.path.exists(lifelog_dir):
+            with os.scandir(lifelog_dir) as entries:
+                actual_count = sum(1 for e in entries if e.name.endswith('.jpg'))
+        lifelog_file_counts[today] = actual_count
 
     interval_min = CONFIG["lifelog_interval"] // 60
     return f"ライフログは{status}です。今日は{actual_count}枚撮影しました。撮影間隔は{interval_min}分です。"
@@ -1358,59 +2231,59 @@ def lifelog_status_func():
 
 # ==================== ツール実行 ====================
 
+# ツール名 → 引数のdictを受け取って実行する関数
+TOOL_HANDLERS = {
+    "gmail_list": lambda a: gmail_list_func(
+        query=a.get("query", "is:unread"),
+        max_results=a.get("max_results", 5)
+    ),
+    "gmail_read": lambda a: gmail_read_func(a.get("message_id")),
+    "gmail_send": lambda a: gmail_send_func(
+        to=a.get("to"),
+        subject=a.get("subject"),
+        body=a.get("body")
+    ),
+    "gmail_reply": lambda a: gmail_reply_func(
+        message_id=a.get("message_id"),
+        body=a.get("body"),
+        attach_photo=a.get("attach_photo", False)
+    ),
+    "alarm_set": lambda a: alarm_set_func(
+        time_str=a.get("time"),
+        label=a.get("label", "アラーム"),
+        message=a.get("message", "")
+    ),
+    "alarm_list": lambda a: alarm_list_func(),
+    "alarm_delete": lambda a: alarm_delete_func(a.get("alarm_id")),
+    "camera_capture": lambda a: camera_capture_func(a.get("prompt", "この画像に何が写っていますか？")),
+    "gmail_send_photo": lambda a: gmail_send_photo_func(
+        to=a.get("to"),
+        subject=a.get("subject", "写真を送ります"),
+        body=a.get("body", "")
+    ),
+    "voice_send": lambda a: voice_send_func(),
+    "voice_send_photo": lambda a: voice_send_photo_func(),
+    "lifelog_start": lambda a: lifelog_start_func(),
+    "lifelog_stop": lambda a: lifelog_stop_func(),
+    "lifelog_status": lambda a: lifelog_status_func(),
+}
+
+
+# 通信・撮影・ファイル書き込みを伴うツール（イベントループをブロックしないよう別スレッドで実行）
+BLOCKING_TOOLS = frozenset({
+    "gmail_list", "gmail_read", "gmail_send", "gmail_reply", "gmail_send_photo",
+    "camera_capture", "voice_send_photo", "alarm_set", "alarm_delete",
+})
+
+
 def execute_tool(tool_name, arguments):
     """ツールを実行"""
     print(f"🔧 ツール実行: {tool_name} - {arguments}")
 
-    if tool_name == "gmail_list":
-        return gmail_list_func(
-            query=arguments.get("query", "is:unread"),
-            max_results=arguments.get("max_results", 5)
-        )
-    elif tool_name == "gmail_read":
-        return gmail_read_func(arguments.get("message_id"))
-    elif tool_name == "gmail_send":
-        return gmail_send_func(
-            to=arguments.get("to"),
-            subject=arguments.get("subject"),
-            body=arguments.get("body")
-        )
-    elif tool_name == "gmail_reply":
-        return gmail_reply_func(
-            message_id=arguments.get("message_id"),
-            body=arguments.get("body"),
-            attach_photo=arguments.get("attach_photo", False)
-        )
-    elif tool_name == "alarm_set":
-        return alarm_set_func(
-            time_str=arguments.get("time"),
-            label=arguments.get("label", "アラーム"),
-            message=arguments.get("message", "")
-        )
-    elif tool_name == "alarm_list":
-        return alarm_list_func()
-    elif tool_name == "alarm_delete":
-        return alarm_delete_func(arguments.get("alarm_id"))
-    elif tool_name == "camera_capture":
-        return camera_capture_func(arguments.get("prompt", "この画像に何が写っていますか？"))
-    elif tool_name == "gmail_send_photo":
-        return gmail_send_photo_func(
-            to=arguments.get("to"),
-            subject=arguments.get("subject", "写真を送ります"),
-            body=arguments.get("body", "")
-        )
-    elif tool_name == "voice_send":
-        return voice_send_func()
-    elif tool_name == "voice_send_photo":
-        return voice_send_photo_func()
-    elif tool_name == "lifelog_start":
-        return lifelog_start_func()
-    elif tool_name == "lifelog_stop":
-        return lifelog_stop_func()
-    elif tool_name == "lifelog_status":
-        return lifelog_status_func()
-    else:
+    handler = TOOL_HANDLERS.get(tool_name)
+    if handler is None:
         return f"不明なツール: {tool_name}"
+    return handler(arguments)
 
 
 # ==================== Realtime API用ツール定義 ====================
@@ -1582,11 +2455,44 @@ class RealtimeAudioHandler:
         self.output_stream = None
         self.is_recording = False
         self.is_playing = False
+        # 再生用キュー（PortAudioのコールバックが取り出す、呼び出し元を止めない）
+        self.output_queue = queue.Queue()
+        self.output_pending = b""  # 取り出し済みで未再生の出力PCM
+        self.output_offset = 0
+        self.output_reset = False  # 割り込み時に再生途中のチャンクも捨てる
+        self.upsample_history = np.zeros(3, dtype=np.int32)  # 2倍アップサンプリングの引き継ぎ
+        self.output_scratch = np.empty(CONFIG["chunk_size"] * 8, dtype=np.int16)  # アップサンプリングの出力先
+        self.input_resample_work = {}  # マイク入力のリサンプリング用の作業配列
+        # 音声処理で毎回参照する設定値（CONFIGの辞書を引かない）
+        self.input_rate = CONFIG["input_sample_rate"]
+        self.api_rate = CONFIG["api_sample_rate"]
+        self.output_rate = CONFIG["output_sample_rate"]  # 出力ストリームを開いたときに更新
+        self.output_frame_bytes = CONFIG["channels"] * 2
+        # コールバックスレッドの優先度は最初の呼び出しで設定する
+        self.input_priority_set = False
+        self.output_priority_set = False
+        # 録音チャンク（PortAudioのコールバックから追加、最大60秒分）
+        self.input_frames = collections.deque(
+            maxlen=int(CONFIG["input_sample_rate"] / CONFIG["chunk_size"] * 60)
+        )
+        # 録音していない間も直近のチャンクを保持（押した瞬間の話し始めを切らない）
+        self.preroll_frames = collections.deque(
+            maxlen=math.ceil(CONFIG["preroll_seconds"] * CONFIG["input_sample_rate"] / CONFIG["chunk_size"])
+        )
+
+    def open_input_stream(self):
+        """
+        マイク入力ストリームを開く（起動中は開いたまま使い回す）
+        ボタンを押すたびのデバイス初期化を避ける
+        """
+        if self.input_stream:
+            return True
 
-    def start_input_stream(self):
         input_device = CONFIG["input_device_index"]
         if input_device is None:
+            # 一度見つけたデバイスは以降の再オープンでも使う（再検索しない）
             input_device = find_audio_device(self.audio, "input")
+            CONFIG["input_device_index"] = input_device
 
         if input_device is None:
             print("❌ 入力デバイスが見つかりません")
@@ -1599,72 +2505,234 @@ class RealtimeAudioHandler:
                 rate=CONFIG["input_sample_rate"],
                 input=True,
                 input_device_index=input_device,
-                frames_per_buffer=CONFIG["chunk_size"]
+                frames_per_buffer=CONFIG["chunk_size"],
+                stream_callback=self._on_input,
+                start=True
             )
-            self.is_recording = True
-            print("🎤 マイク入力開始")
+            print("🎤 マイク入力ストリーム準備完了")
             return True
         except Exception as e:
             print(f"❌ マイク入力エラー: {e}")
             return False
 
+    def _on_input(self, in_data, frame_count, time_info, status):
+        """
+        PortAudioのスレッドから呼ばれる。チャンクを音量と一緒に保持
+        （音量計算を読み出し側のスレッドで行わない）
+        録音中でなければ直前の数チャンクだけをプリロールとして残す
+        """
+        if not self.input_priority_set:
+            self.input_priority_set = True
+            set_realtime_priority("マイク入力")
+        frame = (in_data, chunk_rms(in_data))
+        if self.is_recording:
+            self.input_frames.append(frame)
+        else:
+            self.preroll_frames.append(frame)
+        return (None, pyaudio.paContinue)
+
+    def start_input_stream(self):
+        if not self.open_input_stream():
+            return False
+        self.input_frames.clear()
+        self.is_recording = True
+        # 押す直前の音声を録音の先頭に入れる
+        preroll = list(self.preroll_frames)
+        self.preroll_frames.clear()
+        self.input_frames.extendleft(reversed(preroll))
+        print("🎤 マイク入力開始")
+        return True
+
     def stop_input_stream(self):
+        """録音を止める（ストリームは開いたまま、受信済みのチャンクは読み出せる）"""
+        if self.is_recording:
+            self.is_recording = False
+            print("🎤 マイク入力停止")
+
+    def close_input_stream(self):
         if self.input_stream:
             self.is_recording = False
             self.input_stream.stop_stream()
             self.input_stream.close()
             self.input_stream = None
-            print("🎤 マイク入力停止")
+            print("🎤 マイク入力ストリーム終了")
+
+    def read_input_frame(self):
+        """
+        録音済みのチャンクを1つ取り出す（なければNone、待たない）
+
+        Returns:
+            (生データ(44100Hz), RMS音量) のタプル
+        """
+        try:
+            return self.input_frames.popleft()
+        except IndexError:
+            return None
 
     def read_audio_chunk(self, raw=False):
         """
-        音声チャンクを読み取る
+        録音済みの音声チャンクを1つ取り出す（なければNone、待たない）
 
         Args:
             raw: Trueの場合、リサンプリングせずに生データ(44100Hz)を返す
         """
-        if self.input_stream and self.is_recording:
-            try:
-                data = self.input_stream.read(CONFIG["chunk_size"], exception_on_overflow=False)
-                if raw:
-                    return data  # 生データ(44100Hz)をそのまま返す
-                resampled = resample_audio(data, CONFIG["input_sample_rate"], CONFIG["api_sample_rate"])
-                return resampled
-            except Exception as e:
-                print(f"音声読み取りエラー: {e}")
+        frame = self.read_input_frame()
+        if frame is None:
+            return None
+        data = frame[0]
+        if raw:
+            return data  # 生データ(44100Hz)をそのまま返す
+        try:
+            return resample_audio(data, self.input_rate, self.api_rate, self.input_resample_work)
+        except Exception as e:
+            print(f"音声読み取りエラー: {e}")
         return None
 
     def start_output_stream(self):
         output_device = CONFIG["output_device_index"]
         if output_device is None:
             output_device = find_audio_device(self.audio, "output")
-
-        self.output_stream = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=CONFIG["channels"],
-            rate=CONFIG["output_sample_rate"],
-            output=True,
-            output_device_index=output_device,
-            frames_per_buffer=CONFIG["chunk_size"] * 2
-        )
+            CONFIG["output_device_index"] = output_device
+
+        # デバイスがAPIと同じ24kHzで開ければ応答音声のリサンプリングが不要になる
+        # 開けなければ従来の出力サンプルレート(48kHz)に戻す
+        rates = [CONFIG["api_sample_rate"]]
+        if CONFIG["output_sample_rate"] != CONFIG["api_sample_rate"]:
+            rates.append(CONFIG["output_sample_rate"])
+        for i, rate in enumerate(rates):
+            try:
+                self.output_stream = self.audio.open(
+                    format=pyaudio.paInt16,
+                    channels=CONFIG["channels"],
+                    rate=rate,
+                    output=True,
+                    output_device_index=output_device,
+                    frames_per_buffer=CONFIG["chunk_size"] * rate // CONFIG["api_sample_rate"],  # 約43ms
+                    stream_callback=self._on_output,
+                    start=False
+                )
+            except Exception as e:
+                if i == len(rates) - 1:
+                    raise
+                print(f"⚠️ {rate}Hzで出力できません: {e}")
+                continue
+            CONFIG["output_sample_rate"] = rate
+            self.output_rate = rate
+            print(f"🔊 出力サンプルレート: {rate}Hz")
+            break
         self.is_playing = True
+        self.output_stream.start_stream()
         print("🔊 スピーカー出力開始")
 
+    def _convert_output(self, chunk, rate):
+        """再生キューのチャンクを出力サンプルレートに変換（PortAudioのスレッドで実行）"""
+        if rate == self.output_rate:
+            return chunk
+        if self.output_rate == rate * 2:
+            # 変換結果は使い回しの配列に書き込む（前のチャンクを出し切ってから次を変換するので上書きしてよい）
+            samples = len(chunk) // 2
+            if len(self.output_scratch) < samples * 2:
+                self.output_scratch = np.empty(samples * 2, dtype=np.int16)
+            resampled, self.upsample_history = upsample_2x(chunk, self.upsample_history, self.output_scratch)
+            return resampled
+        return resample_audio(chunk, rate, self.output_rate)
+
+    def _on_output(self, in_data, frame_count, time_info, status):
+        """
+        PortAudioのスレッドから呼ばれる。再生キューから必要な分だけ取り出して返す
+        再生する音声がなければ無音で埋める
+        """
+        if not self.output_priority_set:
+            self.output_priority_set = True
+            set_realtime_priority("スピーカー出力")
+        if self.output_reset:
+            self.output_reset = False
+            self.output_pending = b""
+            self.output_offset = 0
+            self.upsample_history = np.zeros(3, dtype=np.int32)
+
+        needed = frame_count * self.output_frame_bytes
+        out = bytearray()
+        while len(out) < needed:
+            if self.output_offset >= len(self.output_pending):
+                try:
+                    chunk, rate = self.output_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if chunk is None:
+                    # 完了マーカー（ここまでの音声は出力済み）
+                    rate["played"] = True
+                    rate["event"].set()
+                    continue
+                try:
+                    self.output_pending = self._convert_output(chunk, rate)
+                except Exception as e:
+                    print(f"音声再生エラー: {e}")
+                    self.output_pending = b""
+                self.output_offset = 0
+                continue
+
+            take = min(needed - len(out), len(self.output_pending) - self.output_offset)
+            out += self.output_pending[self.output_offset:self.output_offset + take]
+            self.output_offset += take
+
+        if len(out) < needed:
+            out += bytes(needed - len(out))
+        return (bytes(out), pyaudio.paContinue)
+
+    def enqueue_output(self, chunk, rate=None):
+        """
+        PCMチャンクを再生キューに追加
+
+        Args:
+            chunk: 16bitモノラルPCM
+            rate: chunkのサンプルレート（省略時は出力サンプルレート）
+        """
+        if self.output_stream and self.is_playing:
+            self.output_queue.put((chunk, rate or self.output_rate))
+            return True
+        return False
+
+    def clear_output(self):
+        """再生待ちの音声を破棄（割り込み時に使用）"""
+        self.output_reset = True
+        try:
+            while True:
+                chunk, marker = self.output_queue.get_nowait()
+                if chunk is None:
+                    # 完了を待っている側には再生されずに破棄されたことを伝える
+                    marker["event"].set()
+        except queue.Empty:
+            pass
+
+    def wait_output_done(self):
+        """
+        ここまでに再生キューへ追加した音声が出力されるまで待つ
+
+        Returns:
+            最後まで再生されたらTrue（割り込み・停止で破棄された場合はFalse）
+        """
+        marker = {"event": threading.Event(), "played": False}
+        if not (self.output_stream and self.is_playing):
+            return False
+        self.output_queue.put((None, marker))
+        while not marker["event"].wait(1.0):
+            if not (self.output_stream and self.is_playing):
+                return False
+        return marker["played"]
+
     def stop_output_stream(self):
         if self.output_stream:
             self.is_playing = False
             self.output_stream.stop_stream()
             self.output_stream.close()
             self.output_stream = None
+            self.clear_output()
             print("🔊 スピーカー出力停止")
 
     def play_audio_chunk(self, audio_data):
-        if self.output_stream and self.is_playing:
-            try:
-                resampled = resample_audio(audio_data, CONFIG["api_sample_rate"], CONFIG["output_sample_rate"])
-                self.output_stream.write(resampled)
-            except Exception as e:
-                print(f"音声再生エラー: {e}")
+        """Realtime APIの音声(24kHz)を再生キューに追加（リサンプリングは出力コールバックで行う）"""
+        self.enqueue_output(audio_data, self.api_rate)
 
     def play_audio_buffer(self, audio_data):
         """
@@ -1685,26 +2753,50 @@ class RealtimeAudioHandler:
 
                 # 必要に応じてリサンプリング
                 if original_rate != CONFIG["output_sample_rate"]:
-                    audio_np = np.frombuffer(frames, dtype=np.int16)
-                    ratio = CONFIG["output_sample_rate"] / original_rate
-                    new_length = int(len(audio_np) * ratio)
-                    indices = np.linspace(0, len(audio_np) - 1, new_length).astype(int)
-                    resampled = audio_np[indices]
-                    frames = resampled.astype(np.int16).tobytes()
-
-                # 既存の出力ストリームに書き込み
+                    frames = resample_buffer(frames, original_rate, CONFIG["output_sample_rate"])
+
+                # 再生キュー経由で既存の出力ストリームに書き込み
                 if self.output_stream and self.is_playing:
                     chunk_size = 4096
-                    for i in range(0, len(frames), chunk_size):
-                        self.output_stream.write(frames[i:i+chunk_size])
+                    view = memoryview(frames)  # スライスごとのコピーを避ける
+                    for i in range(0, len(view), chunk_size):
+                        self.enqueue_output(view[i:i+chunk_size])
                 else:
                     print("⚠️ 出力ストリームが利用不可")
 
         except Exception as e:
             print(f"音声バッファ再生エラー: {e}")
 
+    def play_pcm_stream(self, chunks):
+        """
+        PCMチャンク（出力サンプルレート、16bitモノラル）を届いた順に再生
+        既存の出力ストリームを使用
+
+        Returns:
+            再生したバイト数
+        """
+        if not (self.output_stream and self.is_playing):
+            print("⚠️ 出力ストリームが利用不可")
+            return 0
+
+        print("🔊 音声ストリーム再生中...")
+
+        played = 0
+        try:
+            for chunk in chunks:
+                if not self.enqueue_output(chunk):
+                    break
+                played += len(chunk)
+        except Exception as e:
+            print(f"音声ストリーム再生エラー: {e}")
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+        return played
+
     def cleanup(self):
-        self.stop_input_stream()
+        self.close_input_stream()
         self.stop_output_stream()
         if self.audio:
             self.audio.terminate()
@@ -1712,6 +2804,15 @@ class RealtimeAudioHandler:
 
 # ==================== Realtime APIクライアント ====================
 
+# 繰り返し送る固定メッセージ（送信のたびに辞書の作成・json.dumpsをしない）
+MSG_AUDIO_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+MSG_AUDIO_APPEND_SUFFIX = '"}'
+MSG_AUDIO_COMMIT = json.dumps({"type": "input_audio_buffer.commit"})
+MSG_AUDIO_CLEAR = json.dumps({"type": "input_audio_buffer.clear"})
+MSG_RESPONSE_CREATE = json.dumps({"type": "response.create"})
+MSG_RESPONSE_CANCEL = json.dumps({"type": "response.cancel"})
+
+
 class RealtimeClient:
     """OpenAI Realtime APIクライアント"""
 
@@ -1719,8 +2820,16 @@ class RealtimeClient:
     MAX_RECONNECT_ATTEMPTS = 5
     RECONNECT_DELAY_BASE = 2  # 秒（指数バックオフの基底）
 
+    # 会話履歴設定（古いアイテムを削除してコンテキストを小さく保つ）
+    MAX_CONVERSATION_TURNS = 6
+    MAX_INPUT_TOKENS = 6000  # 1応答あたりの入力トークン数の目安（指示・ツール定義を含む）
+
+    # マイク音声の送信設定（小さなチャンクをまとめて1メッセージにする）
+    AUDIO_SEND_BYTES = CONFIG["api_sample_rate"] // 10 * 2  # 100ms分
+    AUDIO_SEND_INTERVAL = 0.08  # 秒（溜まりきらなくてもこの間隔で送信）
+
     def __init__(self, audio_handler: RealtimeAudioHandler):
-        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.api_key = OPENAI_API_KEY
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY が設定されていません")
 
@@ -1732,6 +2841,11 @@ class RealtimeClient:
         self.loop = None  # イベントループ参照（スレッド間通信用）
         self.needs_reconnect = False  # 再接続が必要かどうか
         self.reconnect_count = 0  # 連続再接続回数
+        self.conversation_items = []  # [(item_id, ユーザー発話かどうか)]
+        self.last_input_tokens = 0  # 直前の応答の入力トークン数（response.doneのusage）
+        self.audio_send_buffer = bytearray()  # 未送信のマイク音声(24kHz)
+        self.audio_send_started = 0.0  # 未送信分の最初のチャンクを受け取った時刻
+        self.sock = None  # WebSocketの下のTCPソケット
 
     async def connect(self):
         url = f"wss://api.openai.com/v1/realtime?model={CONFIG['model']}"
@@ -1742,13 +2856,59 @@ class RealtimeClient:
 
         print(f"🔗 Realtime APIに接続中... ({CONFIG['model']})")
 
-        self.ws = await websockets.connect(url, additional_headers=headers, ping_interval=20, ping_timeout=20)
+        # permessage-deflate: base64音声は最速の圧縮レベルでも縮み方がほぼ同じなのでCPU負荷を優先
+        deflate = ClientPerMessageDeflateFactory(
+            client_max_window_bits=12,
+            compress_settings={"level": 1, "memLevel": 5},
+        )
+        self.ws = await websockets.connect(
+            url, additional_headers=headers, ping_interval=20, ping_timeout=20,
+            extensions=[deflate], compression=None
+        )
+        self.tune_socket()
         self.is_connected = True
-        self.loop = asyncio.get_event_loop()  # イベントループを保存
+        self.conversation_items = []  # 新しいセッションは履歴なし
+        self.last_input_tokens = 0
+        self.audio_send_buffer.clear()
+        self.loop = asyncio.get_running_loop()  # イベントループを保存
         print("✅ Realtime API接続完了")
 
         await self.configure_session()
 
+    def tune_socket(self):
+        """小さな音声フレームを待たせずに送る（Nagle無効化、Linuxでは遅延ACKも抑制）"""
+        sock = self.ws.transport.get_extra_info("socket")
+        self.sock = sock
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if hasattr(socket, "TCP_QUICKACK"):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except OSError as e:
+            print(f"ソケット設定エラー: {e}")
+
+    def set_cork(self, enabled):
+        """TCP_CORKの切り替え（Linuxのみ）。解除した時点で溜めた分をまとめて送出"""
+        if self.sock is None or not hasattr(socket, "TCP_CORK"):
+            return
+        try:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if enabled else 0)
+        except OSError:
+            pass
+
+    async def send_many(self, *messages):
+        """
+        続けて送る複数のメッセージを少ないTCPセグメントにまとめて送信
+        （Nagleを無効にしているので、そのままだと1メッセージごとに送出される）
+        """
+        self.set_cork(True)
+        try:
+            for message in messages:
+                await self.ws.send(message)
+        finally:
+            self.set_cork(False)
+
     async def configure_session(self):
         session_config = {
             "type": "session.update",
@@ -1765,33 +2925,56 @@ class RealtimeClient:
             }
         }
 
-        await self.ws.send(json.dumps(session_config))
+        await self.ws.send(json_dumps(session_config))
         print("📝 セッション設定完了（ツール有効）")
 
     async def send_audio_chunk(self, audio_data):
+        """マイク音声を溜めて、100ms分または一定時間ごとにまとめて送信"""
         if not self.is_connected or not self.ws:
             return
 
-        encoded = base64.b64encode(audio_data).decode("utf-8")
-        message = {"type": "input_audio_buffer.append", "audio": encoded}
-        await self.ws.send(json.dumps(message))
+        if not self.audio_send_buffer:
+            self.audio_send_started = time.monotonic()
+        self.audio_send_buffer.extend(audio_data)
+
+        if (len(self.audio_send_buffer) >= self.AUDIO_SEND_BYTES
+                or time.monotonic() - self.audio_send_started >= self.AUDIO_SEND_INTERVAL):
+            await self.flush_audio()
+
+    async def flush_audio(self):
+        """溜まっているマイク音声を1メッセージで送信"""
+        if not self.audio_send_buffer or not self.ws:
+            return
+
+        # base64モジュールのラッパーを通さない（pybase64があればSIMD版、音声の送受信は頻度が高い）
+        encoded = b64encode_str(self.audio_send_buffer)
+        self.audio_send_buffer.clear()
+        # base64はJSONのエスケープが不要なので固定の前後部分で挟むだけでよい
+        await self.ws.send(MSG_AUDIO_APPEND_PREFIX + encoded + MSG_AUDIO_APPEND_SUFFIX)
 
     async def commit_audio(self):
         if not self.is_connected or not self.ws:
             return
 
-        await self.ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
-        await self.ws.send(json.dumps({"type": "response.create"}))
+        # 残りの音声・コミット・応答要求を1回の送出にまとめる
+        self.set_cork(True)
+        try:
+            await self.flush_audio()
+            await self.ws.send(MSG_AUDIO_COMMIT)
+            await self.ws.send(MSG_RESPONSE_CREATE)
+        finally:
+            self.set_cork(False)
         print("📤 音声送信完了、応答待ち...")
 
     async def cancel_response(self):
         if self.is_responding and self.ws:
-            await self.ws.send(json.dumps({"type": "response.cancel"}))
+            await self.ws.send(MSG_RESPONSE_CANCEL)
             print("⚡ 応答をキャンセル（割り込み）")
 
     async def clear_input_buffer(self):
+        self.audio_send_buffer.clear()
         if self.ws:
-            await self.ws.send(json.dumps({"type": "input_audio_buffer.clear"}))
+            await self.ws.send(MSG_AUDIO_CLEAR)
 
     async def send_text_message(self, text):
         """テキストメッセージを音声で読み上げる（アラーム通知用）"""
@@ -1799,7 +2982,7 @@ class RealtimeClient:
             return
 
         # システムメッセージとして直接読み上げ（会話履歴に残さない）
-        await self.ws.send(json.dumps({
+        await self.ws.send(json_dumps({
             "type": "response.create",
             "response": {
                 "modalities": ["audio", "text"],
@@ -1818,10 +3001,30 @@ class RealtimeClient:
                 "output": result
             }
         }
-        await self.ws.send(json.dumps(message))
-        await self.ws.send(json.dumps({"type": "response.create"}))
+        await self.send_many(json_dumps(message), MSG_RESPONSE_CREATE)
         print(f"📤 ツール結果送信: {result[:100]}...")
 
+    async def trim_conversation(self):
+        """
+        古い会話アイテムを削除
+        直近 MAX_CONVERSATION_TURNS ターンまで残すが、入力トークン数が
+        MAX_INPUT_TOKENS を超えた場合は1ターンあたりの平均から残すターン数を減らす
+        （メール本文などの長いツール結果を含むターンが続いた場合）
+        """
+        user_positions = [i for i, (_, is_user) in enumerate(self.conversation_items) if is_user]
+        keep = self.MAX_CONVERSATION_TURNS
+        if self.last_input_tokens > self.MAX_INPUT_TOKENS and user_positions:
+            tokens_per_turn = self.last_input_tokens / len(user_positions)
+            keep = min(keep, max(1, int(self.MAX_INPUT_TOKENS / tokens_per_turn)))
+        if len(user_positions) <= keep:
+            return
+
+        cut = user_positions[-keep]
+        for item_id, _ in self.conversation_items[:cut]:
+            await self.ws.send(json_dumps({"type": "conversation.item.delete", "item_id": item_id}))
+        self.conversation_items = self.conversation_items[cut:]
+        print(f"🧹 古い会話を削除: {cut}件")
+
     async def receive_messages(self):
         global running
         try:
@@ -1829,11 +3032,21 @@ class RealtimeClient:
                 if not running:
                     break
 
-                event = json.loads(message)
-                await self.handle_event(event)
+                event = json_loads(message)
+                if event.get("type") == "response.audio.delta":
+                    # 最も頻度の高いイベントはelifの連鎖を通さずに処理
+                    self.handle_audio_delta(event)
+                else:
+                    await self.handle_event(event)
                 # 正常にメッセージを受信できたら再接続カウントをリセット
                 self.reconnect_count = 0
 
+            if running:
+                # サーバーから正常にクローズされた場合も再接続する
+                print("⚠️ WebSocket接続が閉じられました")
+                self.is_connected = False
+                self.needs_reconnect = True
+
         except websockets.exceptions.ConnectionClosed as e:
             print(f"⚠️ WebSocket接続が閉じられました (code={e.code}, reason={e.reason})")
             self.is_connected = False
@@ -1843,6 +3056,12 @@ class RealtimeClient:
             self.is_connected = False
             self.needs_reconnect = True  # 再接続を要求
 
+    def handle_audio_delta(self, event):
+        """応答音声の断片を再生キューに追加"""
+        audio_b64 = event.get("delta", "")
+        if audio_b64:
+            self.audio_handler.play_audio_chunk(b64decode(audio_b64))
+
     async def handle_event(self, event):
         event_type = event.get("type", "")
 
@@ -1855,11 +3074,14 @@ class RealtimeClient:
         elif event_type == "response.created":
             self.is_responding = True
 
+        elif event_type == "conversation.item.created":
+            item = event.get("item", {})
+            if item.get("id"):
+                is_user = item.get("type") == "message" and item.get("role") == "user"
+                self.conversation_items.append((item["id"], is_user))
+
         elif event_type == "response.audio.delta":
-            audio_b64 = event.get("delta", "")
-            if audio_b64:
-                audio_data = base64.b64decode(audio_b64)
-                self.audio_handler.play_audio_chunk(audio_data)
+            self.handle_audio_delta(event)
 
         elif event_type == "response.audio_transcript.delta":
             text = event.get("delta", "")
@@ -1876,14 +3098,13 @@ class RealtimeClient:
             arguments_str = event.get("arguments", "{}")
 
             try:
-                arguments = json.loads(arguments_str)
+                arguments = json_loads(arguments_str)
             except:
                 arguments = {}
 
             # 長時間かかるツールは別スレッドで実行（イベントループをブロックしない）
-            if name in ["voice_send_photo", "camera_capture", "gmail_send_photo"]:
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, lambda: execute_tool(name, arguments))
+            if name in BLOCKING_TOOLS:
+                result = await asyncio.to_thread(execute_tool, name, arguments)
             else:
                 result = execute_tool(name, arguments)
 
@@ -1895,6 +3116,9 @@ class RealtimeClient:
             self.is_responding = False
             print("✅ 応答完了")
 
+            usage = event.get("response", {}).get("usage") or {}
+            self.last_input_tokens = usage.get("input_tokens", 0)
+
             # ペンディング中のツール結果を送信
             if self.pending_tool_calls:
                 # 音声再生が完了するまで少し待つ
@@ -1902,6 +3126,9 @@ class RealtimeClient:
                 for call_id, result in self.pending_tool_calls.items():
                     await self.send_tool_result(call_id, result)
                 self.pending_tool_calls = {}
+            else:
+                # ツール結果待ちでなければ古い会話を整理
+                await self.trim_conversation()
 
         elif event_type == "conversation.item.input_audio_transcription.completed":
             transcript = event.get("transcript", "")
@@ -1936,7 +3163,8 @@ class RealtimeClient:
         delay = self.RECONNECT_DELAY_BASE ** self.reconnect_count
         delay = min(delay, 60)  # 最大60秒
         print(f"🔄 {delay}秒後に再接続を試みます... (試行 {self.reconnect_count}/{self.MAX_RECONNECT_ATTEMPTS})")
-        await asyncio.sleep(delay)
+        if await wait_for_shutdown(delay):
+            return False
 
         # 古い接続をクリーンアップ
         await self.disconnect()
@@ -1955,12 +3183,35 @@ class RealtimeClient:
             self.needs_reconnect = True
             return False
 
+async def speak_canned(client: RealtimeClient, audio_handler: RealtimeAudioHandler, text):
+    """定型文を保存済みの音声で再生（用意できなければRealtime APIで読み上げ）"""
+    pcm = await asyncio.to_thread(get_canned_speech, text)
+    if not pcm:
+        await client.send_text_message(text)
+        return
+
+    print(f"📢 システム通知: {text}")
+    chunk_bytes = CONFIG["api_sample_rate"] // 10 * 2  # 100ms（割り込み時に破棄できる単位）
+    view = memoryview(pcm)
+    for i in range(0, len(view), chunk_bytes):
+        audio_handler.play_audio_chunk(view[i:i + chunk_bytes])
+
+
 async def audio_input_loop(client: RealtimeClient, audio_handler: RealtimeAudioHandler):
     """音声入力ループ"""
     global running, button, is_recording, voice_message_mode
 
+    # ボタンの押下・解放をgpiozeroのスレッドから通知してもらう（ポーリングしない）
+    loop = asyncio.get_running_loop()
+    pressed_event = asyncio.Event()
+    released_event = asyncio.Event()
+    use_button = button is not None  # ループ中は変わらない
+    if use_button:
+        button.when_pressed = lambda: loop.call_soon_threadsafe(pressed_event.set)
+        button.when_released = lambda: loop.call_soon_threadsafe(released_event.set)
+
     while running:
-        if CONFIG["use_button"] and button:
+        if use_button:
             if button.is_pressed:
                 if not is_recording:
                     # タイムアウトチェック付きで voice_message_mode を確認
@@ -1972,21 +3223,23 @@ async def audio_input_loop(client: RealtimeClient, audio_handler: RealtimeAudioH
                         print("🔴 音声メッセージ録音開始（スレッドモード）")
                         is_recording = True
                         # スレッドで実行してイベントループをブロックしない
-                        loop = asyncio.get_event_loop()
-                        success = await loop.run_in_executor(None, send_recorded_voice_message)
+                        success = await asyncio.to_thread(send_recorded_voice_message)
                         is_recording = False
                         # 結果を音声で通知
                         if success:
-                            await client.send_text_message("メッセージをスマホに送信しました。")
+                            await speak_canned(client, audio_handler, "メッセージをスマホに送信しました。")
                         else:
-                            await client.send_text_message("送信に失敗しました。")
+                            await speak_canned(client, audio_handler, "送信に失敗しました。")
                         continue
                     else:
                         print("🔴 ボタン押下検出 - 録音開始")
                         if client.is_responding:
                             await client.cancel_response()
+                        # 再生待ちの音声を破棄（応答完了後の再生中でも割り込めるように）
+                        audio_handler.clear_output()
                         await client.clear_input_buffer()
 
+                        released_event.clear()
                         if audio_handler.start_input_stream():
                             is_recording = True
                         else:
@@ -1994,32 +3247,72 @@ async def audio_input_loop(client: RealtimeClient, audio_handler: RealtimeAudioH
                             continue
 
                 # 通常モード: リサンプリング済み(24000Hz)をRealtime APIに送信
-                chunk = audio_handler.read_audio_chunk(raw=False)
-                if chunk:
+                while True:
+                    chunk = audio_handler.read_audio_chunk(raw=False)
+                    if not chunk:
+                        break
                     await client.send_audio_chunk(chunk)
             else:
                 if is_recording:
                     is_recording = False
                     audio_handler.stop_input_stream()
+                    # ボタンを離すまでに録音された残りを送信
+                    while True:
+                        chunk = audio_handler.read_audio_chunk(raw=False)
+                        if not chunk:
+                            break
+                        await client.send_audio_chunk(chunk)
                     # 通常モード: Realtime APIに送信
                     print("⚪ ボタン離す - 録音停止、送信中...")
                     await client.commit_audio()
                     print("✅ 音声送信完了 - AI応答待ち")
+                else:
+                    # 待機中は押下されるまで眠る（終了確認のため0.5秒ごとに起きる）
+                    pressed_event.clear()
+                    if not button.is_pressed:
+                        try:
+                            await asyncio.wait_for(pressed_event.wait(), timeout=0.5)
+                        except asyncio.TimeoutError:
+                            pass
+                    continue
+
+            if is_recording:
+                # 録音中は届いた音声を送るために起きつつ、離されたら即座に送信処理へ
+                try:
+                    await asyncio.wait_for(released_event.wait(), timeout=0.02)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
         await asyncio.sleep(0.01)
 
 
 async def main_async():
     """非同期メインループ（自動再接続対応）"""
-    global running, button, alarm_client, global_audio_handler
+    global running, button, alarm_client, global_audio_handler, shutdown_loop, shutdown_event
+
+    # 実行中はシグナルをイベントループで受け取り、待機中の処理を待たずに終了処理へ進む
+    loop = asyncio.get_running_loop()
+    shutdown_event = asyncio.Event()
+    shutdown_loop = loop
+    if not running:
+        shutdown_event.set()  # 起動処理中に終了要求があった
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, signal_handler, sig, None)
+        except (NotImplementedError, RuntimeError):
+            pass  # 対応していない環境ではsignal.signalの登録のまま
 
     audio_handler = RealtimeAudioHandler()
     audio_handler.start_output_stream()
+    audio_handler.open_input_stream()
     global_audio_handler = audio_handler  # グローバルに設定（スマホ音声再生用）
 
     client = RealtimeClient(audio_handler)
     receive_task = None
     input_task = None
+    shutdown_task = asyncio.create_task(shutdown_event.wait())
     first_start = True
 
     try:
@@ -2045,7 +3338,7 @@ async def main_async():
                     except Exception as e:
                         print(f"❌ 接続エラー: {e}")
                         print("🔄 5秒後に再試行します...")
-                        await asyncio.sleep(5)
+                        await wait_for_shutdown(5)
                         continue
 
                 # タスクを開始/再開
@@ -2058,12 +3351,12 @@ async def main_async():
                     print("\n" + "=" * 50)
                     print("AI Necklace Realtime 起動（全機能版）")
                     print("=" * 50)
-                    print(f"Gmail: {'有効' if gmail_service else '無効'}")
+                    print(f"Gmail: {'有効' if gmail_service else ('初期化中' if gmail_initializing else '無効')}")
                     print(f"Firebase: {'有効' if firebase_messenger else '無効'}")
                     print(f"アラーム: {len(alarms)}件")
                     print(f"カメラ: 有効")
                     print(f"ライフログ: 待機中（{CONFIG['lifelog_interval'] // 60}分間隔）")
-                    if CONFIG["use_button"]:
+                    if button is not None:
                         print(f"操作: GPIO{CONFIG['button_pin']}のボタンを押している間話す")
                     print("=" * 50)
                     print("\nコマンド例:")
@@ -2085,7 +3378,8 @@ async def main_async():
                     # 再接続時は短い通知音
                     print("🔔 再接続完了 - 会話を再開できます")
 
-            await asyncio.sleep(0.1)
+            # 切断（受信タスクの終了）か終了要求まで待つ
+            await asyncio.wait({receive_task, shutdown_task}, return_when=asyncio.FIRST_COMPLETED)
 
         # タスクをキャンセル
         if receive_task:
@@ -2103,11 +3397,32 @@ async def main_async():
 
     except Exception as e:
         print(f"❌ エラー: {e}")
-        import traceback
         traceback.print_exc()
     finally:
+        shutdown_task.cancel()
+        shutdown_loop = None
         await client.disconnect()
         audio_handler.cleanup()
+        with camera_lock:
+            close_camera()
+
+
+def setup_pin_factory():
+    """
+    ボタン用のGPIOピンファクトリを設定
+
+    pigpioはデーモン側でエッジを時刻付きで検出するため、押下の検出が速くぶれも少ない。
+    pigpiodに接続できない場合はgpiozeroの既定のファクトリのまま使う
+    """
+    if CONFIG["button_pin_factory"] != "pigpio":
+        return
+
+    try:
+        from gpiozero.pins.pigpio import PiGPIOFactory
+        Device.pin_factory = PiGPIOFactory()
+        print("GPIO: pigpio")
+    except Exception as e:
+        print(f"pigpioを使用できません（既定のGPIOを使用）: {e}")
 
 
 def main():
@@ -2117,38 +3432,47 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    api_key = os.getenv("OPENAI_API_KEY")
+    api_key = OPENAI_API_KEY
     if not api_key:
         print("エラー: OPENAI_API_KEY が設定されていません")
         sys.exit(1)
 
-    # OpenAIクライアント（カメラ用）
-    openai_client = OpenAI(api_key=api_key)
+    # OpenAIクライアント（カメラ・文字起こし・定型音声用）
+    # 接続を保持して、リクエストごとのTLSハンドシェイクを避ける
+    # h2があればHTTP/2で1本の接続に多重化する
+    http_client = httpx.Client(
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=30.0,
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300)
+    )
+    openai_client = OpenAI(api_key=api_key, http_client=http_client)
 
-    # Gmail初期化
-    init_gmail()
+    # Gmail初期化（トークン更新などで時間がかかるためバックグラウンドで実行）
+    start_gmail_init()
 
     # Firebase初期化
     init_firebase()
+    if firebase_messenger:
+        prepare_canned_speech()
 
     # アラーム読み込み
     load_alarms()
 
-    # ボタン初期化
+    # ボタン初期化（使えない場合はbuttonをNoneのままにし、設定値は書き換えない）
+    button = None
     if CONFIG["use_button"] and GPIO_AVAILABLE:
+        setup_pin_factory()
         try:
-            button = Button(CONFIG["button_pin"], pull_up=True, bounce_time=0.1)
+            button = Button(CONFIG["button_pin"], pull_up=True,
+                            bounce_time=CONFIG["button_bounce_time"])
             print(f"ボタン: GPIO{CONFIG['button_pin']}")
         except Exception as e:
             print(f"ボタン初期化エラー: {e}")
-            button = None
-            CONFIG["use_button"] = False
-    else:
-        button = None
-        if CONFIG["use_button"]:
-            CONFIG["use_button"] = False
 
-    asyncio.run(main_async())
+    if UVLOOP_AVAILABLE:
+        uvloop.run(main_async())
+    else:
+        asyncio.run(main_async())
     print("終了しました")
 
 
@@ -29,6 +29,10 @@ except ImportError:
         "storageBucket": os.getenv("FIREBASE_STORAGE_BUCKET", ""),
     }
 
+# 設定から導出するエンドポイント（リクエストごとに組み立てない）
+DATABASE_URL = FIREBASE_CONFIG["databaseURL"].rstrip("/")
+STORAGE_URL = f"https://firebasestorage.googleapis.com/v0/b/{FIREBASE_CONFIG['storageBucket']}/o"
+
 # デバイス識別子
 DEVICE_ID = "raspi"
 
@@ -36,22 +40,29 @@ DEVICE_ID = "raspi"
 class FirebaseVoiceMessenger:
     """Firebase を使った音声メッセージング"""
 
-    def __init__(self, device_id=DEVICE_ID, on_message_received=None):
+    def __init__(self, device_id=DEVICE_ID, on_message_received=None, mark_played_on_receive=True):
         """
         初期化
 
         Args:
             device_id: このデバイスのID（"raspi" または "phone"）
             on_message_received: メッセージ受信時のコールバック関数
+            mark_played_on_receive: コールバック後すぐに再生済みにマークする
+                                    （Falseなら呼び出し側が再生後にmark_as_playedを呼ぶ）
         """
         self.device_id = device_id
         self.on_message_received = on_message_received
-        self.db_url = FIREBASE_CONFIG["databaseURL"]
+        self.mark_played_on_receive = mark_played_on_receive
+        self.db_url = DATABASE_URL
         self.storage_bucket = FIREBASE_CONFIG["storageBucket"]
+        self.storage_url = STORAGE_URL
+        self.messages_url = f"{DATABASE_URL}/messages.json"
         self.api_key = FIREBASE_CONFIG["apiKey"]
         self.running = False
         self.listener_thread = None
         self.last_processed_key = None
+        # HTTPS接続を使い回す（ポーリングごとのTLSハンドシェイクを避ける）
+        self.session = requests.Session()
 
     def upload_audio(self, audio_data: bytes, filename: str = None) -> str:
         """
@@ -69,7 +80,7 @@ class FirebaseVoiceMessenger:
             filename = f"{self.device_id}_{timestamp}.wav"
 
         # Firebase Storage REST API エンドポイント
-        storage_url = f"https://firebasestorage.googleapis.com/v0/b/{self.storage_bucket}/o"
+        storage_url = self.storage_url
 
         # ファイルパスをURLエンコード
         encoded_path = requests.utils.quote(f"audio/{filename}", safe='')
@@ -79,7 +90,7 @@ class FirebaseVoiceMessenger:
             "Content-Type": "audio/wav",
         }
 
-        response = requests.post(upload_url, headers=headers, data=audio_data)
+        response = self.session.post(upload_url, headers=headers, data=audio_data)
 
         if response.status_code == 200:
             # ダウンロードURLを生成
@@ -106,7 +117,7 @@ class FirebaseVoiceMessenger:
             filename = f"{self.device_id}_{timestamp}.jpg"
 
         # Firebase Storage REST API エンドポイント
-        storage_url = f"https://firebasestorage.googleapis.com/v0/b/{self.storage_bucket}/o"
+        storage_url = self.storage_url
 
         # ファイルパスをURLエンコード（audioフォルダを使用）
         encoded_path = requests.utils.quote(f"audio/{filename}", safe='')
@@ -116,7 +127,7 @@ class FirebaseVoiceMessenger:
             "Content-Type": "image/jpeg",
         }
 
-        response = requests.post(upload_url, headers=headers, data=photo_data)
+        response = self.session.post(upload_url, headers=headers, data=photo_data)
 
         if response.status_code == 200:
             # ダウンロードURLを生成
@@ -127,13 +138,16 @@ class FirebaseVoiceMessenger:
             print(f"写真アップロードエラー: {response.status_code} - {response.text}")
             return None
 
-    def send_message(self, audio_data: bytes, text: str = None) -> bool:
+    def send_message(self, audio_data: bytes, text=None) -> bool:
         """
         音声メッセージを送信
 
         Args:
             audio_data: 音声バイナリデータ
             text: テキスト（音声の文字起こしなど、オプション）
+                  文字列・None、またはそのどちらかを返す呼び出し可能オブジェクト
+                  呼び出し可能な場合は音声のアップロード後に呼び出して取得する
+                  （文字起こしとアップロードを並行させるため）
 
         Returns:
             成功したかどうか
@@ -143,6 +157,9 @@ class FirebaseVoiceMessenger:
         filename = f"{self.device_id}_{timestamp}.wav"
         audio_url = self.upload_audio(audio_data, filename)
 
+        if callable(text):
+            text = text()
+
         if not audio_url:
             return False
 
@@ -158,8 +175,7 @@ class FirebaseVoiceMessenger:
         if text:
             message_data["text"] = text
 
-        db_url = f"{self.db_url}/messages.json"
-        response = requests.post(db_url, json=message_data)
+        response = self.session.post(self.messages_url, json=message_data)
 
         if response.status_code == 200:
             print(f"メッセージ送信成功: {filename}")
@@ -200,8 +216,7 @@ class FirebaseVoiceMessenger:
         if text:
             message_data["text"] = text
 
-        db_url = f"{self.db_url}/messages.json"
-        response = requests.post(db_url, json=message_data)
+        response = self.session.post(self.messages_url, json=message_data)
 
         if response.status_code == 200:
             print(f"写真メッセージ送信成功: {filename}")
@@ -225,7 +240,7 @@ class FirebaseVoiceMessenger:
         # Firebase Storage にアップロード
         # パス: lifelogs/{date}/{time}.jpg
         filename = f"{time_str}.jpg"
-        storage_url = f"https://firebasestorage.googleapis.com/v0/b/{self.storage_bucket}/o"
+        storage_url = self.storage_url
         encoded_path = requests.utils.quote(f"lifelogs/{date}/{filename}", safe='')
         upload_url = f"{storage_url}/{encoded_path}"
 
@@ -233,7 +248,7 @@ class FirebaseVoiceMessenger:
             "Content-Type": "image/jpeg",
         }
 
-        response = requests.post(upload_url, headers=headers, data=photo_data)
+        response = self.session.post(upload_url, headers=headers, data=photo_data)
 
         if response.status_code != 200:
             print(f"ライフログ写真アップロードエラー: {response.status_code} - {response.text}")
@@ -261,7 +276,7 @@ class FirebaseVoiceMessenger:
 
         # Realtime Database REST API
         db_url = f"{self.db_url}/lifelogs/{date}/{time_str}.json"
-        response = requests.put(db_url, json=doc_data)
+        response = self.session.put(db_url, json=doc_data)
 
         if response.status_code == 200:
             print(f"ライフログメタデータ保存成功: {date} {time_formatted}")
@@ -283,8 +298,7 @@ class FirebaseVoiceMessenger:
             メッセージリスト
         """
         # シンプルなクエリ（orderByはインデックス設定が必要なため使わない）
-        db_url = f"{self.db_url}/messages.json"
-        response = requests.get(db_url)
+        response = self.session.get(self.messages_url)
 
         if response.status_code != 200:
             print(f"メッセージ取得エラー: {response.status_code}")
@@ -320,13 +334,32 @@ class FirebaseVoiceMessenger:
         Returns:
             音声バイナリデータ
         """
-        response = requests.get(audio_url)
+        response = self.session.get(audio_url)
         if response.status_code == 200:
             return response.content
         else:
             print(f"ダウンロードエラー: {response.status_code}")
             return None
 
+    def download_audio_stream(self, audio_url: str, chunk_size: int = 8192):
+        """
+        音声データを受信しながら逐次返す（全体のダウンロード完了を待たない）
+
+        Args:
+            audio_url: 音声ファイルのURL
+            chunk_size: 一度に返す最大バイト数
+
+        Yields:
+            音声バイナリデータの断片
+        """
+        with self.session.get(audio_url, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                print(f"ダウンロードエラー: {response.status_code}")
+                return
+            for chunk in response.iter_content(chunk_size):
+                if chunk:
+                    yield chunk
+
     def mark_as_played(self, message_id: str):
         """
         メッセージを再生済みにマーク
@@ -335,20 +368,106 @@ class FirebaseVoiceMessenger:
             message_id: メッセージID
         """
         db_url = f"{self.db_url}/messages/{message_id}/played.json"
-        response = requests.put(db_url, json=True)
+        response = self.session.put(db_url, json=True)
         if response.status_code == 200:
             print(f"メッセージ {message_id} を再生済みにしました")
 
-    def start_listening(self, poll_interval: float = 3.0):
+    def stream_events(self):
         """
-        新着メッセージの監視を開始（ポーリング方式）
+        Realtime DatabaseのストリーミングAPI（Server-Sent Events）でmessagesの変更を受け取る
+
+        接続直後にmessages全体が path="/" で届き、以降は変更のあった箇所だけが届く
+
+        Yields:
+            (イベント名, パス, データ)
+        """
+        headers = {"Accept": "text/event-stream"}
+        # キープアライブが約30秒ごとに届くので、それより長く無通信なら切断とみなす
+        with self.session.get(self.messages_url, headers=headers, stream=True, timeout=(10, 90)) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"ストリーム接続エラー: {response.status_code}")
+            response.encoding = "utf-8"
+
+            event = None
+            # chunk_size=Noneで届いた分から処理する（バッファが埋まるのを待たない）
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not self.running:
+                    return
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    if event in ("put", "patch"):
+                        payload = json.loads(line[5:])
+                        yield event, payload["path"], payload["data"]
+                    elif event in ("cancel", "auth_revoked"):
+                        raise RuntimeError(f"ストリームが終了しました: {event}")
+
+    def start_listening(self, poll_interval: float = 3.0, use_stream: bool = True):
+        """
+        新着メッセージの監視を開始
 
         Args:
-            poll_interval: ポーリング間隔（秒）
+            poll_interval: ポーリング間隔（秒）。ストリーミング時は切断後の再接続間隔
+            use_stream: ストリーミングAPIで変更を受け取る（Falseならポーリング方式）
         """
         self.running = True
         self.processed_ids = set()  # 処理済みメッセージIDを追跡
 
+        def handle_message(msg_id, msg):
+            # 自分以外からの未処理メッセージのみ
+            if msg_id in self.processed_ids or not isinstance(msg, dict):
+                return
+            if msg.get("from") == self.device_id:
+                return
+            msg["id"] = msg_id
+
+            # 新着メッセージ
+            print(f"\n新着メッセージ: {msg.get('from')} - {msg.get('filename')}")
+
+            if self.on_message_received:
+                self.on_message_received(msg)
+
+            # 処理済みに追加
+            self.processed_ids.add(msg_id)
+
+            # 再生済みにマーク
+            if self.mark_played_on_receive:
+                self.mark_as_played(msg_id)
+
+        def is_full_message(data):
+            # メッセージ本体（played等の一部の項目だけの更新ではない）
+            return isinstance(data, dict) and ("audio_url" in data or "photo_url" in data)
+
+        def stream_loop():
+            first_snapshot = True
+            while self.running:
+                try:
+                    for event, path, data in self.stream_events():
+                        if path == "/":
+                            items = data.items() if isinstance(data, dict) else ()
+                            if event == "put" and first_snapshot:
+                                # 既存のメッセージIDを記録（起動時に全て処理済みとする）
+                                for msg_id, msg in items:
+                                    if isinstance(msg, dict) and msg.get("from") != self.device_id:
+                                        self.processed_ids.add(msg_id)
+                                print(f"既存メッセージ {len(self.processed_ids)} 件をスキップ")
+                                first_snapshot = False
+                                continue
+                            # 再接続時のスナップショットや追加分は古い順に処理
+                            # （patchには既存メッセージの一部の項目だけの更新も含まれるので除く）
+                            messages = [(k, v) for k, v in items if "/" not in k and is_full_message(v)]
+                            messages.sort(key=lambda kv: kv[1].get("timestamp", 0))
+                            for msg_id, msg in messages[-15:]:
+                                handle_message(msg_id, msg)
+                        elif path.count("/") == 1 and is_full_message(data):
+                            # 新しいメッセージ（/messages/{id}）の追加
+                            handle_message(path[1:], data)
+                except Exception as e:
+                    print(f"ストリーミングエラー: {e}")
+
+                if self.running:
+                    time.sleep(poll_interval)
+
         def poll_loop():
             # 既存のメッセージIDを記録（起動時に全て処理済みとする）
             messages = self.get_messages(limit=20)
@@ -362,30 +481,15 @@ class FirebaseVoiceMessenger:
                     messages = self.get_messages(limit=15, unplayed_only=False)
 
                     for msg in reversed(messages):  # 古い順に処理
-                        msg_id = msg.get("id")
-
-                        # 既に処理済みならスキップ
-                        if msg_id in self.processed_ids:
-                            continue
-
-                        # 新着メッセージ
-                        print(f"\n新着メッセージ: {msg.get('from')} - {msg.get('filename')}")
-
-                        if self.on_message_received:
-                            self.on_message_received(msg)
-
-                        # 処理済みに追加
-                        self.processed_ids.add(msg_id)
-
-                        # 再生済みにマーク
-                        self.mark_as_played(msg_id)
+                        handle_message(msg.get("id"), msg)
 
                 except Exception as e:
                     print(f"ポーリングエラー: {e}")
 
                 time.sleep(poll_interval)
 
-        self.listener_thread = threading.Thread(target=poll_loop, daemon=True)
+        target = stream_loop if use_stream else poll_loop
+        self.listener_thread = threading.Thread(target=target, daemon=True)
         self.listener_thread.start()
         print("メッセージ監視を開始しました")
 
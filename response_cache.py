@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Response Cache Module
+カメラ画像解析の応答をデバイス上にキャッシュするモジュール
+
+「これは何？」「何が見える？」を同じ景色に対して繰り返した場合に
+GPT-4o Vision へのリクエストを省略し、応答までの待ち時間をなくす
+"""
+
+import re
+import time
+import threading
+import unicodedata
+
+import numpy as np
+
+# 画像ハッシュ計算用（オプション）
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# プロンプト正規化時に取り除く文字（空白・句読点・疑問符など）
+_PROMPT_STRIP_RE = re.compile(r'[\s、。，．,.!?！？「」『』]+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    プロンプトを比較用に正規化
+
+    Args:
+        prompt: ユーザーの質問文
+
+    Returns:
+        全角/半角・句読点・空白の揺れを取り除いた文字列
+    """
+    text = unicodedata.normalize("NFKC", prompt or "")
+    return _PROMPT_STRIP_RE.sub("", text).lower()
+
+
+def compute_image_hash(image_path):
+    """
+    画像の64bit知覚ハッシュ（difference hash）を計算
+
+    9x8に縮小したグレースケール画像で、横に隣り合う画素の大小関係を
+    ビット化する。明るさの変化に強く、比較はpopcount1回で済む
+
+    Args:
+        image_path: JPEG画像のパス、またはファイルオブジェクト
+
+    Returns:
+        64bit整数のハッシュ（計算できない場合はNone）
+    """
+    if not PIL_AVAILABLE:
+        return None
+
+    try:
+        with Image.open(image_path) as im:
+            # JPEGはDCTスケーリングで縮小デコードして高速化
+            im.draft("L", (64, 64))
+            small = im.convert("L").resize((9, 8), Image.BILINEAR)
+        pixels = np.asarray(small, dtype=np.int16)
+        bits = pixels[:, 1:] > pixels[:, :-1]
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+    except Exception as e:
+        print(f"画像ハッシュ計算エラー: {e}")
+        return None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュのハミング距離"""
+    return (a ^ b).bit_count()
+
+
+class ResponseCache:
+    """(プロンプト, 画像ハッシュ) をキーにした応答キャッシュ"""
+
+    def __init__(self, ttl: float = 600, max_distance: int = 4, max_entries: int = 32):
+        """
+        初期化
+
+        Args:
+            ttl: キャッシュの有効期間（秒）
+            max_distance: 同じ画像とみなすハッシュのハミング距離の上限
+            max_entries: 保持する最大件数
+        """
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.entries = []  # [(timestamp, prompt_key, image_hash, response)]
+        self.lock = threading.Lock()
+
+    def _expire(self, now: float):
+        """期限切れのエントリを削除（ロック取得済みで呼び出す）"""
+        self.entries = [e for e in self.entries if now - e[0] <= self.ttl]
+
+    def get(self, prompt: str, image_hash) -> str:
+        """
+        キャッシュされた応答を取得
+
+        Args:
+            prompt: ユーザーの質問文
+            image_hash: compute_image_hash() の結果
+
+        Returns:
+            応答テキスト（ヒットしない場合はNone）
+        """
+        if image_hash is None:
+            return None
+
+        key = normalize_prompt(prompt)
+        now = time.time()
+
+        with self.lock:
+            self._expire(now)
+            best = None
+            best_distance = self.max_distance + 1
+            for entry in self.entries:
+                if entry[1] != key:
+                    continue
+                distance = hamming_distance(entry[2], image_hash)
+                if distance < best_distance:
+                    best = entry
+                    best_distance = distance
+
+        return best[3] if best else None
+
+    def put(self, prompt: str, image_hash, response: str):
+        """
+        応答をキャッシュに登録
+
+        Args:
+            prompt: ユーザーの質問文
+            image_hash: compute_image_hash() の結果
+            response: 応答テキスト
+        """
+        if image_hash is None or not response:
+            return
+
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            self.entries.append((now, normalize_prompt(prompt), image_hash, response))
+            if len(self.entries) > self.max_entries:
+                self.entries = self.entries[-self.max_entries:]